@@ -8,6 +8,10 @@ import xml.etree.ElementTree as ET
 import os
 import json
 
+# Bump whenever a change alters what analyze_rack_file returns for the same
+# file; stored analyses from other versions are then not reused for re-uploads
+ANALYZER_VERSION = 1
+
 def decompress_and_parse_ableton_file(file_path):
     """Decompresses an Ableton .adg or .adv file and parses its XML content."""
     try:
@@ -47,10 +51,41 @@ def get_branch_preset_type(rack_type):
     }
     return branch_type_map.get(rack_type)
 
+def iter_devices(chains):
+    """Yield (device, depth) for every device in a list of chains, including those
+    in nested racks; devices in the top-level chains have depth 0"""
+    # Explicit stack rather than recursion: no frame per nested rack and no
+    # recursion limit on pathologically deep racks
+    stack = [(chains, 0)]
+    while stack:
+        nested_chains, depth = stack.pop()
+        for chain in nested_chains:
+            for device in chain.get("devices", ()):
+                yield device, depth
+                if "chains" in device:
+                    stack.append((device["chains"], depth + 1))
+
+def count_devices(chains):
+    """Count all devices in a list of chains, including those in nested racks"""
+    return sum(1 for _ in iter_devices(chains))
+
+def summarize_rack(rack_info):
+    """Compute the aggregate stats stored with and returned for a rack analysis"""
+    chains = rack_info.get("chains", ())
+    return {
+        "total_chains": len(chains),
+        "total_devices": count_devices(chains),
+        "macro_controls": len(rack_info.get("macro_controls", ()))
+    }
+
+def rack_name_from_filename(filename):
+    """Rack name for an uploaded file - always its filename without extension"""
+    return os.path.splitext(os.path.basename(filename))[0] if filename else "Unknown"
+
 def parse_chains_and_devices(xml_root, filename=None, verbose=False):
     """Parse the main rack structure based on actual Ableton XML format"""
     # Always use filename as rack name
-    rack_name_from_file = os.path.splitext(os.path.basename(filename))[0] if filename else "Unknown"
+    rack_name_from_file = rack_name_from_filename(filename)
     
     rack_info = {
         "rack_name": rack_name_from_file,  # Use filename as rack name
@@ -73,12 +108,14 @@ def parse_chains_and_devices(xml_root, filename=None, verbose=False):
         if verbose:
             print("⚠️  Warning: Unable to detect rack type. This may be an unsupported rack format.")
         rack_info["parsing_errors"] = ["Unknown rack type - unable to detect AudioEffectGroupDevice, InstrumentGroupDevice, or MidiEffectGroupDevice"]
+        rack_info["stats"] = summarize_rack(rack_info)
         return rack_info
     
     if main_device is None:
         if verbose:
             print(f"⚠️  Warning: Detected rack type {rack_type} but could not find main device.")
         rack_info["parsing_errors"] = [f"Found rack type {rack_type} but could not locate main device element"]
+        rack_info["stats"] = summarize_rack(rack_info)
         return rack_info
     
     if main_device is not None:
@@ -136,6 +173,9 @@ def parse_chains_and_devices(xml_root, filename=None, verbose=False):
                 print("⚠️  Warning: No BranchPresets element found")
                 rack_info.setdefault("parsing_warnings", []).append("No BranchPresets element found - rack may not contain chains")
     
+    # Aggregate once here so callers and storage don't re-walk the chains
+    rack_info["stats"] = summarize_rack(rack_info)
+    
     return rack_info
 
 def parse_single_chain_branch(branch_preset, chain_index=0, depth=0, verbose=False):
@@ -388,6 +428,31 @@ def parse_device(device_elem, parent_preset=None, depth=0, verbose=False):
     
     return device_info
 
+def analyze_rack_file(file_path, filename=None):
+    """Decompress, parse and analyze a rack file in one call, returning rack_info or None.
+    Takes and returns only picklable values so it can run in a worker process."""
+    xml_root = decompress_and_parse_ableton_file(file_path)
+    if xml_root is None:
+        return None
+    return parse_chains_and_devices(xml_root, filename or file_path)
+
+def analyze_and_export_rack_file(file_path, filename, output_folder, verbose=False):
+    """Analyze a rack file and write its XML and JSON exports next to it.
+    Returns None if the file can't be decompressed, else a dict with rack_info
+    (None if the rack structure couldn't be parsed), xml_path and json_path.
+    Like analyze_rack_file, only picklable values cross the call."""
+    xml_root = decompress_and_parse_ableton_file(file_path)
+    if xml_root is None:
+        return None
+    rack_info = parse_chains_and_devices(xml_root, filename, verbose=verbose)
+    if rack_info is None:
+        return {"rack_info": None, "xml_path": None, "json_path": None}
+    return {
+        "rack_info": rack_info,
+        "xml_path": export_xml_to_file(xml_root, file_path, output_folder),
+        "json_path": export_analysis_to_json(rack_info, file_path, output_folder)
+    }
+
 def export_xml_to_file(xml_root, original_file_path, output_folder="."):
     """Export XML content to file"""
     try:
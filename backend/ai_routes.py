@@ -9,12 +9,21 @@ from functools import wraps
 import os
 import sys
 import traceback
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
 
 ai_bp = Blueprint('ai', __name__)
 
 # Initialize AI analyzer (reuse across requests)
 _ai_analyzer = None
 
+# Automatic analysis of newly uploaded racks runs in the background so
+# uploads don't wait on OpenAI; results land in the rack's ai_analysis field
+AI_ANALYSIS_WORKERS = int(os.getenv('AI_ANALYSIS_WORKERS', '4'))
+_ai_pool = ThreadPoolExecutor(max_workers=AI_ANALYSIS_WORKERS, thread_name_prefix='ai-analysis')
+
 # JWT required decorator (matching the one in app.py)
 def jwt_required():
     def decorator(f):
@@ -63,6 +72,28 @@ def get_ai_analyzer():
             return None, f"Failed to initialize AI analyzer: {str(e)}"
     return _ai_analyzer, None
 
+def _run_ai_analysis(rack_id):
+    """Analyze a rack with OpenAI and save the result to the rack document"""
+    try:
+        analyzer, error = get_ai_analyzer()
+        if error:
+            logger.warning(f"AI analysis skipped for rack {rack_id}: {error}")
+            return
+        
+        analysis_result = analyzer.analyze_rack(rack_id)
+        if 'error' in analysis_result:
+            logger.warning(f"AI analysis failed for rack {rack_id}: {analysis_result['error']}")
+            return
+        
+        analyzer.mongodb.update_rack_ai_analysis(rack_id, analysis_result)
+        logger.info(f"AI analysis complete for rack {rack_id}")
+    except Exception as e:
+        logger.error(f"AI analysis error for rack {rack_id}: {e}")
+
+def submit_ai_analysis(rack_id):
+    """Queue background AI analysis of a rack; poll the rack for its ai_analysis field"""
+    _ai_pool.submit(_run_ai_analysis, rack_id)
+
 @ai_bp.route('/ai/status', methods=['GET'])
 def ai_status():
     """Check AI service status"""
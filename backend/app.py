@@ -7,28 +7,42 @@ Updated to leverage embedded documents and reduce query complexity
 import os
 import sys
 import json
+import re
 import tempfile
 import shutil
 import logging
+import hashlib
+import threading
+import time
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import Counter
 from datetime import datetime
 from pathlib import Path
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory, render_template, stream_with_context
 from flask_cors import CORS
+from flask_compress import Compress
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+import bson
 from bson import ObjectId
 import jwt
-from functools import wraps
+from functools import wraps, lru_cache
 import secrets
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from cachetools import TLRUCache, TTLCache
 from security import validate_password, validate_email, sanitize_username
+from json_provider import OrjsonProvider
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Import the analyzer modules
-from abletonRackAnalyzer import decompress_and_parse_ableton_file, parse_chains_and_devices, export_xml_to_file, export_analysis_to_json
+from abletonRackAnalyzer import analyze_rack_file, rack_name_from_filename
 
 # Import optimized MongoDB helper
 from db_v3_optimized import db_v3 as db
@@ -45,6 +59,19 @@ app = Flask(__name__,
            template_folder=str(project_root / 'templates'),
            static_folder=str(project_root / 'static'),
            static_url_path='/static')
+app.json = OrjsonProvider(app)
+
+# Compress JSON and HTML responses over 1 KB (brotli when the client accepts
+# it, else gzip). Streamed file downloads are passed through untouched.
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+app.config['COMPRESS_LEVEL'] = 4
+app.config['COMPRESS_BR_LEVEL'] = 4
+app.config['COMPRESS_MIN_SIZE'] = 1024
+Compress(app)
+
+# Flask-Compress appends the encoding to a compressed response's ETag
+# ("<etag>:br"), and clients send that value back in If-None-Match
+COMPRESSED_ETAG_SUFFIX = re.compile(r':(?:br|gzip|deflate)"')
 
 # Configure CORS
 CORS(app, resources={
@@ -55,7 +82,25 @@ CORS(app, resources={
     }
 })
 
-limiter = Limiter(get_remote_address, app=app, default_limits=["200 per day", "50 per hour"])
+# Rate limit counters are per process unless RATELIMIT_STORAGE_URI points at a
+# shared store (e.g. redis://host:6379/1), which keeps limits correct across workers
+RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'memory://')
+# Header carrying the real client IP when behind a trusted proxy (e.g. CF-Connecting-IP)
+RATELIMIT_CLIENT_IP_HEADER = os.getenv('RATELIMIT_CLIENT_IP_HEADER')
+
+def _client_ip_key():
+    if RATELIMIT_CLIENT_IP_HEADER:
+        client_ip = request.headers.get(RATELIMIT_CLIENT_IP_HEADER)
+        if client_ip:
+            return client_ip
+    return get_remote_address()
+
+limiter = Limiter(
+    _client_ip_key,
+    app=app,
+    default_limits=["200 per day", "50 per hour"],
+    storage_uri=RATELIMIT_STORAGE_URI
+)
 
 # Register AI routes blueprint
 app.register_blueprint(ai_bp, url_prefix='/api')
@@ -68,15 +113,16 @@ app.config['SESSION_COOKIE_SECURE'] = True
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 ALLOWED_EXTENSIONS = {'adg', 'adv'}
-
-# Security headers middleware
-@app.after_request
-def set_security_headers(response):
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'DENY'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
-    response.headers['Content-Security-Policy'] = (
+_ALLOWED_SUFFIXES = tuple('.' + ext for ext in sorted(ALLOWED_EXTENSIONS))
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Read size for raw upload bodies
+
+# Security headers - built once and applied to every response
+_SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'X-XSS-Protection': '1; mode=block',
+    'Strict-Transport-Security': 'max-age=31536000; includeSubDomains',
+    'Content-Security-Policy': (
         "default-src 'self'; "
         "script-src 'self' 'unsafe-inline'; "
         "style-src 'self' 'unsafe-inline'; "
@@ -84,11 +130,157 @@ def set_security_headers(response):
         "font-src 'self'; "
         "connect-src 'self'; "
         "frame-ancestors 'none';"
-    )
-    return response
+    ),
+}
+_SECURITY_HEADER_ITEMS = list(_SECURITY_HEADERS.items())
+_SECURITY_HEADER_NAMES = frozenset(name.lower() for name in _SECURITY_HEADERS)
+
+def _security_headers_middleware(wsgi_app):
+    """
+    WSGI middleware appending the prebuilt security headers to every
+    response, including error responses that bypass after_request handlers
+    """
+    def middleware(environ, start_response):
+        def start_response_with_headers(status, headers, exc_info=None):
+            headers = [header for header in headers if header[0].lower() not in _SECURITY_HEADER_NAMES]
+            headers.extend(_SECURITY_HEADER_ITEMS)
+            return start_response(status, headers, exc_info)
+        return wsgi_app(environ, start_response_with_headers)
+    return middleware
+
+app.wsgi_app = _security_headers_middleware(app.wsgi_app)
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(_ALLOWED_SUFFIXES)
+
+# Rack analysis (gzip + XML parsing) is CPU-bound, so it runs in a process
+# pool to let concurrent uploads use every core instead of contending for the GIL.
+# The pool is created on first use so each server worker process gets its own.
+# gunicorn already runs about two workers per core (gunicorn.conf.py), so one
+# analysis process per worker covers every core; ANALYSIS_WORKERS raises it.
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', '1'))
+_analysis_pool = None
+_analysis_pool_lock = threading.Lock()
+
+def _get_analysis_pool():
+    global _analysis_pool
+    with _analysis_pool_lock:
+        if _analysis_pool is None:
+            # spawn rather than fork: the server process runs request threads
+            _analysis_pool = ProcessPoolExecutor(
+                max_workers=ANALYSIS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _analysis_pool
+
+def _analyze_in_pool(filepath, filename):
+    """Run analyze_rack_file in the analysis pool, replacing the pool if a worker died"""
+    global _analysis_pool
+    pool = _get_analysis_pool()
+    try:
+        return pool.submit(analyze_rack_file, filepath, filename).result()
+    except BrokenProcessPool:
+        with _analysis_pool_lock:
+            if _analysis_pool is pool:
+                _analysis_pool = None
+        raise
+
+# JWT verification settings, resolved once instead of per request
+JWT_SECRET_KEY = app.config['SECRET_KEY']
+JWT_ALGORITHMS = ('HS256',)
+
+# Verified JWT cache - decoded payloads are kept until the token's own expiry
+# (capped at TOKEN_CACHE_TTL seconds); failures are never cached
+TOKEN_CACHE_TTL = 60
+
+def _token_cache_ttu(_key, payload, now):
+    return min(payload.get('exp', now), now + TOKEN_CACHE_TTL)
+
+_token_cache = TLRUCache(maxsize=10000, ttu=_token_cache_ttu, timer=time.time)
+_token_cache_lock = threading.Lock()
+
+# Authenticated users, cached briefly by ID. Handlers only use the user's ID
+# and username, so only those are loaded rather than the whole embedded user
+# document.
+USER_CACHE_TTL = 60
+AUTH_USER_PROJECTION = {'username': 1}
+_user_cache = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+
+def _verify_token(token):
+    """
+    Decode and verify a JWT, returning its payload.
+    Raises jwt.InvalidTokenError subclasses for bad tokens.
+    """
+    key = hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+    with _token_cache_lock:
+        payload = _token_cache.get(key)
+    if payload is None:
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=JWT_ALGORITHMS)
+        with _token_cache_lock:
+            _token_cache[key] = payload
+    return payload
+
+def _get_cached_user(user_id):
+    with _user_cache_lock:
+        user = _user_cache.get(user_id)
+    if user is None:
+        # Get user from v3 optimized structure
+        user = db.users_collection.find_one({'_id': ObjectId(user_id)}, AUTH_USER_PROJECTION)
+        if user:
+            user['_id'] = str(user['_id'])
+            with _user_cache_lock:
+                _user_cache[user_id] = user
+    return user
+
+def _verify_and_load_user(token):
+    """
+    Decode a JWT and load its user, returning (payload, user).
+    user is None when the token is valid but the user no longer exists.
+    Raises jwt.InvalidTokenError subclasses for bad tokens.
+    """
+    payload = _verify_token(token)
+    return payload, _get_cached_user(payload['user_id'])
+
+# Download counts are batched in memory and flushed to MongoDB in a single
+# bulk write every few seconds instead of one write per download
+DOWNLOAD_COUNT_FLUSH_INTERVAL = 2  # seconds
+_pending_downloads = Counter()
+_pending_downloads_lock = threading.Lock()
+_download_flusher_pid = None
+
+def _flush_download_counts():
+    """Write pending download counts, keeping any that weren't applied for the next flush"""
+    with _pending_downloads_lock:
+        pending = dict(_pending_downloads)
+        _pending_downloads.clear()
+    
+    if not pending:
+        return
+    failed = db.increment_download_counts(pending)
+    if failed:
+        with _pending_downloads_lock:
+            _pending_downloads.update(failed)
+
+def _download_count_flusher():
+    while True:
+        time.sleep(DOWNLOAD_COUNT_FLUSH_INTERVAL)
+        try:
+            _flush_download_counts()
+        except Exception as e:
+            logger.error(f"Failed to flush download counts: {e}")
+
+def _queue_download_count(rack_id):
+    """Count a download, starting this process's flusher thread on first use"""
+    global _download_flusher_pid
+    with _pending_downloads_lock:
+        _pending_downloads[rack_id] += 1
+        # Threads don't survive fork, so each server worker starts its own
+        if _download_flusher_pid != os.getpid():
+            _download_flusher_pid = os.getpid()
+            threading.Thread(target=_download_count_flusher, name='download-count-flusher', daemon=True).start()
+
+atexit.register(_flush_download_counts)
 
 # Authentication decorator (simplified for v3 structure)
 def token_required(f):
@@ -107,15 +299,9 @@ def token_required(f):
             return jsonify({'error': 'Token is missing'}), 401
 
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user_id = data['user_id']
-            
-            # Get user from v3 optimized structure
-            current_user = db.users_collection.find_one({'_id': ObjectId(current_user_id)})
+            _, current_user = _verify_and_load_user(token)
             if not current_user:
                 return jsonify({'error': 'Invalid token'}), 401
-                
-            current_user['_id'] = str(current_user['_id'])
             
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token has expired'}), 401
@@ -128,15 +314,57 @@ def token_required(f):
         return f(current_user, *args, **kwargs)
     return decorated
 
+# Built frontend, listed once at startup: asset lookups are a set membership
+# test, with no stat per request and no way to reach files outside the build
+FRONTEND_DIR = os.path.join(backend_root, 'static', 'frontend')
+FRONTEND_ASSETS_MAX_AGE = 31536000  # Vite's assets/ filenames are content-hashed
+
+def _list_frontend_files():
+    files = set()
+    for root, _dirs, names in os.walk(FRONTEND_DIR):
+        rel_root = os.path.relpath(root, FRONTEND_DIR).replace(os.sep, '/')
+        for name in names:
+            files.add(name if rel_root == '.' else f"{rel_root}/{name}")
+    return frozenset(files)
+
+FRONTEND_FILES = _list_frontend_files()
+
+def _send_frontend_file(path):
+    if path.startswith('assets/'):
+        response = send_from_directory(FRONTEND_DIR, path, conditional=True, max_age=FRONTEND_ASSETS_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+    return send_from_directory(FRONTEND_DIR, path, conditional=True)
+
+@lru_cache(maxsize=1)
+def _index_html():
+    """index.html and its ETag, read once - it is the fallback for every client-side route"""
+    with open(os.path.join(FRONTEND_DIR, 'index.html'), 'rb') as f:
+        body = f.read()
+    return body, hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def _index_response():
+    body, etag = _index_html()
+    response = app.response_class(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(_without_compressed_etags(request.environ))
+
+def _without_compressed_etags(environ):
+    """The request environ with Flask-Compress's encoding suffix stripped from If-None-Match"""
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return environ
+    return {**environ, 'HTTP_IF_NONE_MATCH': COMPRESSED_ETAG_SUFFIX.sub('"', if_none_match)}
+
 # Frontend serving routes
 @app.route('/')
 def home():
     """Serve React frontend"""
     try:
-        index_path = os.path.join(backend_root, 'static', 'frontend', 'index.html')
-        if not os.path.exists(index_path):
+        if 'index.html' not in FRONTEND_FILES:
             return jsonify({"error": "Frontend not found"}), 500
-        return send_file(index_path)
+        return _index_response()
     except Exception as e:
         logger.error(f"Error serving frontend: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -147,14 +375,92 @@ def serve_frontend(path):
     if path.startswith('api/'):
         return {'error': 'API endpoint not found'}, 404
     
-    static_file_path = os.path.join(backend_root, 'static', 'frontend', path)
-    if os.path.exists(static_file_path) and os.path.isfile(static_file_path):
-        return send_file(static_file_path)
+    if path in FRONTEND_FILES:
+        return _send_frontend_file(path)
     
-    return send_file(os.path.join(backend_root, 'static', 'frontend', 'index.html'))
+    return _index_response()
 
 # API Routes - Optimized for v3 embedded document structure
 
+def _current_user_id():
+    """User ID from the request's bearer token, or None for anonymous uploads"""
+    if 'Authorization' in request.headers:
+        try:
+            auth_header = request.headers['Authorization']
+            token = auth_header.split(' ')[1]
+            # Attribution only needs the verified user_id, not a user lookup
+            return _verify_token(token)['user_id']
+        except:
+            pass  # Continue as anonymous upload
+    return None
+
+def _analyze_and_save(filename, filepath, file_content, metadata_json=None):
+    """Analyze an uploaded rack already written to filepath, save it and build the response"""
+    logger.info(f"Analyzing file: {filename}")
+    
+    try:
+        # Identical files analyze identically apart from the filename-derived
+        # name, so a re-upload (e.g. of a stock rack) skips the parse
+        content_sha256 = hashlib.sha256(file_content).hexdigest()
+        rack_info = db.find_analysis_by_content(content_sha256)
+        if rack_info:
+            logger.info(f"Reusing analysis of identical upload {content_sha256}")
+            rack_info['rack_name'] = rack_info['use_case'] = rack_name_from_filename(filename)
+        else:
+            rack_info = _analyze_in_pool(filepath, filename)
+        
+        if not rack_info:
+            return jsonify({'error': 'Failed to analyze the rack file'}), 400
+        
+        # Get enhanced metadata from request if provided
+        enhanced_metadata = None
+        if metadata_json:
+            try:
+                enhanced_metadata = json.loads(metadata_json)
+            except json.JSONDecodeError:
+                logger.warning("Invalid metadata JSON provided")
+        
+        # Save with optimized v3 structure (single operation with all data
+        # embedded); the saved document is returned, so it isn't read back
+        rack_data = db.save_rack_document(
+            rack_info, 
+            filename, 
+            file_content=file_content,
+            user_id=_current_user_id(),
+            enhanced_metadata=enhanced_metadata,
+            content_sha256=content_sha256
+        )
+        
+        if not rack_data:
+            return jsonify({'error': 'Failed to save analysis'}), 500
+        
+        rack_id = rack_data['_id']
+        logger.info(f"Successfully analyzed and saved rack with ID: {rack_id}")
+        
+        return jsonify({
+            'success': True,
+            'rack_id': rack_id,
+            'analysis': rack_data,
+            'message': 'Rack analyzed and saved successfully'
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error analyzing rack file: {e}")
+        return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
+    
+    finally:
+        # Clean up uploaded file
+        try:
+            os.remove(filepath)
+        except OSError:
+            pass
+
+def _upload_path(filename):
+    """Unique path in UPLOAD_FOLDER for an upload, so concurrent uploads of the same name don't collide"""
+    fd, filepath = tempfile.mkstemp(suffix=f'_{filename}', dir=app.config['UPLOAD_FOLDER'])
+    os.close(fd)
+    return filepath
+
 @app.route('/api/analyze', methods=['POST'])
 @limiter.limit("10 per hour")
 def analyze_rack():
@@ -175,81 +481,63 @@ def analyze_rack():
             return jsonify({'error': 'Invalid file type. Only .adg and .adv files are allowed'}), 400
         
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        filepath = _upload_path(filename)
         
-        # Get file content for storage
-        with open(filepath, 'rb') as f:
-            file_content = f.read()
+        # Read the upload once and reuse the buffer for both the analyzer's
+        # copy on disk and database storage
+        file_content = file.stream.read()
+        Path(filepath).write_bytes(file_content)
         
-        # Analyze the file
-        logger.info(f"Analyzing file: {filename}")
+        return _analyze_and_save(filename, filepath, file_content, request.form.get('metadata'))
+    
+    except Exception as e:
+        logger.error(f"Error in analyze endpoint: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/analyze/stream', methods=['POST'])
+@limiter.limit("10 per hour")
+def analyze_rack_stream():
+    """
+    Same as /api/analyze for a rack file sent as a raw application/octet-stream
+    body, named by the X-Filename header or ?filename= (metadata JSON goes in
+    ?metadata=). The body is read in chunks straight off the socket, skipping
+    multipart parsing and Werkzeug's spooled temp file.
+    """
+    try:
+        if request.mimetype != 'application/octet-stream':
+            return jsonify({'error': 'Content-Type must be application/octet-stream'}), 415
         
-        try:
-            rack_info = decompress_and_parse_ableton_file(filepath)
-            
-            if not rack_info:
-                return jsonify({'error': 'Failed to analyze the rack file'}), 400
-            
-            # Get enhanced metadata from request if provided
-            enhanced_metadata = None
-            if request.form.get('metadata'):
-                try:
-                    enhanced_metadata = json.loads(request.form.get('metadata'))
-                except json.JSONDecodeError:
-                    logger.warning("Invalid metadata JSON provided")
-            
-            # Get user ID from token if present
-            user_id = None
-            if 'Authorization' in request.headers:
-                try:
-                    auth_header = request.headers['Authorization']
-                    token = auth_header.split(' ')[1]
-                    data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-                    user_id = data['user_id']
-                except:
-                    pass  # Continue as anonymous upload
-            
-            # Save with optimized v3 structure (single operation with all data embedded)
-            rack_id = db.save_rack_analysis(
-                rack_info, 
-                filename, 
-                file_content=file_content,
-                user_id=user_id,
-                enhanced_metadata=enhanced_metadata
-            )
-            
-            if not rack_id:
-                return jsonify({'error': 'Failed to save analysis'}), 500
-            
-            # Get the complete rack data (now a single query thanks to embedding)
-            rack_data = db.get_rack_with_full_data(rack_id)
-            
-            if not rack_data:
-                return jsonify({'error': 'Failed to retrieve saved analysis'}), 500
-            
-            logger.info(f"Successfully analyzed and saved rack with ID: {rack_id}")
-            
-            return jsonify({
-                'success': True,
-                'rack_id': rack_id,
-                'analysis': rack_data,
-                'message': 'Rack analyzed and saved successfully'
-            }), 200
-            
-        except Exception as e:
-            logger.error(f"Error analyzing rack file: {e}")
-            return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
+        original_filename = request.headers.get('X-Filename') or request.args.get('filename', '')
+        if not original_filename:
+            return jsonify({'error': 'No filename provided'}), 400
         
-        finally:
-            # Clean up uploaded file
-            try:
-                os.remove(filepath)
-            except OSError:
-                pass
+        if not allowed_file(original_filename):
+            return jsonify({'error': 'Invalid file type. Only .adg and .adv files are allowed'}), 400
+        
+        filename = secure_filename(original_filename)
+        filepath = _upload_path(filename)
+        
+        # Write each chunk to disk as it arrives, keeping the chunks for
+        # database storage so the file is never read back
+        chunks = []
+        try:
+            # request.stream is capped at MAX_CONTENT_LENGTH
+            with open(filepath, 'wb') as f:
+                for chunk in iter(lambda: request.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                    f.write(chunk)
+                    chunks.append(chunk)
+        except RequestEntityTooLarge:
+            os.remove(filepath)
+            return jsonify({'error': 'File too large'}), 413
+        
+        if not chunks:
+            os.remove(filepath)
+            return jsonify({'error': 'Empty file'}), 400
+        
+        return _analyze_and_save(filename, filepath, b''.join(chunks), request.args.get('metadata'))
     
     except Exception as e:
-        logger.error(f"Error in analyze endpoint: {e}")
+        logger.error(f"Error in analyze stream endpoint: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/racks/<rack_id>', methods=['GET'])
@@ -283,9 +571,46 @@ def get_recent_racks():
     """Get recent racks with embedded data"""
     try:
         limit = min(int(request.args.get('limit', 10)), 50)
+        # Optional comma-separated subset of the summary fields
+        fields = request.args.get('fields')
+        fields = fields.split(',') if fields else None
+        
+        # Paginated requests (?skip=) also get the total rack count
+        if 'skip' in request.args:
+            skip = max(int(request.args.get('skip', 0)), 0)
+            page = db.get_recent_racks_with_count(limit, skip, fields)
+            if page is None:
+                return jsonify({'error': 'Failed to retrieve racks'}), 500
+            racks, total = page
+            return jsonify({
+                'success': True,
+                'racks': racks,
+                'count': len(racks),
+                'total': total
+            }), 200
+        
+        mimetype = request.accept_mimetypes.best_match(
+            ('application/json', 'application/x-ndjson', 'application/bson')
+        )
         
-        # Single query gets all embedded data
-        racks = db.get_recent_racks(limit)
+        # Clients asking for NDJSON get one rack per line, written as the
+        # cursor yields them instead of after the whole page is loaded
+        if mimetype == 'application/x-ndjson':
+            return Response(
+                stream_with_context(_ndjson_lines(db.iter_recent_racks(limit, fields))),
+                mimetype='application/x-ndjson'
+            )
+        
+        # BSON clients get the documents exactly as MongoDB sent them: raw
+        # documents are copied into the response without being decoded
+        if mimetype == 'application/bson':
+            racks = db.get_recent_racks(limit, fields, raw=True)
+            return Response(
+                bson.encode({'success': True, 'racks': racks, 'count': len(racks)}),
+                mimetype='application/bson'
+            )
+        
+        racks = db.get_recent_racks(limit, fields)
         
         return jsonify({
             'success': True,
@@ -297,6 +622,15 @@ def get_recent_racks():
         logger.error(f"Error getting recent racks: {e}")
         return jsonify({'error': 'Failed to retrieve racks'}), 500
 
+def _ndjson_lines(docs):
+    """Serialize documents as newline-delimited JSON, one line per document"""
+    try:
+        for doc in docs:
+            yield app.json.dumps(doc) + '\n'
+    except Exception as e:
+        # Headers are already sent; end the stream early
+        logger.error(f"Error streaming racks: {e}")
+
 @app.route('/api/racks/search', methods=['GET'])
 def search_racks():
     """Search racks with embedded data"""
@@ -309,6 +643,13 @@ def search_racks():
         if len(query) < 2:
             return jsonify({'error': 'Query must be at least 2 characters'}), 400
         
+        # NDJSON clients get results as the cursor yields them, as for /api/racks
+        if request.accept_mimetypes.best_match(('application/json', 'application/x-ndjson')) == 'application/x-ndjson':
+            return Response(
+                stream_with_context(_ndjson_lines(db.iter_search_racks(query))),
+                mimetype='application/x-ndjson'
+            )
+        
         # Search with embedded data
         racks = db.search_racks(query)
         
@@ -442,48 +783,55 @@ def add_annotation(current_user, rack_id):
         logger.error(f"Error adding annotation: {e}")
         return jsonify({'error': 'Failed to add annotation'}), 500
 
-@app.route('/api/racks/<rack_id>/download', methods=['POST'])
+@app.route('/api/racks/<rack_id>/download', methods=['GET', 'POST'])
 def download_rack(rack_id):
     """Download rack and increment download count"""
     try:
         if not ObjectId.is_valid(rack_id):
             return jsonify({'error': 'Invalid rack ID'}), 400
         
-        # Get rack data
-        rack_data = db.get_rack_with_full_data(rack_id)
+        # Get the rack's original file (streamed from GridFS)
+        rack = db.get_rack_file(rack_id)
         
-        if not rack_data or 'file_content' not in rack_data:
+        if not rack or rack['file'] is None:
             return jsonify({'error': 'Rack file not available'}), 404
         
-        # Increment download count atomically
-        db.increment_download_count(rack_id)
-        
-        # Prepare file for download
-        import base64
-        file_content = base64.b64decode(rack_data['file_content'].encode('utf-8'))
-        
-        # Create temporary file
-        temp_path = os.path.join(tempfile.gettempdir(), f"{rack_data['filename']}")
-        with open(temp_path, 'wb') as f:
-            f.write(file_content)
-        
-        return send_file(
-            temp_path,
+        # The stored file never changes for a given rack, so the rack ID is a
+        # stable ETag and repeat downloads can be answered with a 304
+        response = send_file(
+            rack['file'],
             as_attachment=True,
-            download_name=rack_data['filename'],
-            mimetype='application/octet-stream'
+            download_name=rack['filename'],
+            mimetype='application/octet-stream',
+            conditional=True,
+            etag=rack['_id'],
+            last_modified=rack.get('created_at')
         )
         
+        # Count the download (not revalidations); the write is batched off
+        # the request path
+        if response.status_code != 304:
+            _queue_download_count(rack_id)
+        
+        return response
+        
     except Exception as e:
         logger.error(f"Error downloading rack: {e}")
         return jsonify({'error': 'Download failed'}), 500
 
+# A worker whose startup connect failed still has to come back once MongoDB
+# does: the platform health check is often the only traffic it gets. Probes
+# try to reconnect at most this often, so a down database isn't hammered.
+HEALTH_RECONNECT_INTERVAL = 5  # seconds
+_last_health_reconnect = 0.0
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint with database connectivity"""
+    global _last_health_reconnect
     try:
-        # Test database connection
-        if not db.connected:
+        if not db.connected and time.monotonic() - _last_health_reconnect >= HEALTH_RECONNECT_INTERVAL:
+            _last_health_reconnect = time.monotonic()
             db.connect()
         
         if not db.connected:
@@ -493,8 +841,9 @@ def health_check():
                 'timestamp': datetime.utcnow().isoformat()
             }), 503
         
-        # Test database query
-        rack_count = db.racks_collection.count_documents({})
+        # Test database query - the estimated count comes from collection
+        # metadata instead of scanning every rack on each probe
+        rack_count = db.racks_collection.estimated_document_count()
         
         return jsonify({
             'status': 'healthy',
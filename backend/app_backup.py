@@ -6,35 +6,49 @@ Flask backend for Ableton Rack Analyzer Web App
 import os
 import sys
 import json
+import re
+from binascii import a2b_base64
 import tempfile
 import shutil
 import logging
-from datetime import datetime
+import threading
+import time
+import atexit
+from collections import Counter
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
 from pathlib import Path
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, request, jsonify, send_file, send_from_directory, render_template, Response
 from flask_cors import CORS
+from flask_compress import Compress
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 from bson import ObjectId
 import jwt
-from functools import wraps
+import msgpack
+from functools import wraps, lru_cache
 import secrets
+import hashlib
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from cachetools import TTLCache
 from security import validate_password, validate_email, sanitize_username
+from json_provider import OrjsonProvider
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Import the analyzer modules (they're in the same directory)
-from abletonRackAnalyzer import decompress_and_parse_ableton_file, parse_chains_and_devices, export_xml_to_file, export_analysis_to_json
+from abletonRackAnalyzer import analyze_and_export_rack_file
 
 # Import MongoDB helper
 from db_new import db_new as db  # Use new database as primary
 
 # Import AI routes
-from ai_routes import ai_bp
-from openai_integration import RackAIAnalyzer
+from ai_routes import ai_bp, submit_ai_analysis
 
 # Import enhanced routes
 from enhanced_routes import enhanced_bp
@@ -47,6 +61,19 @@ app = Flask(__name__,
            template_folder=str(project_root / 'templates'),
            static_folder=str(project_root / 'static'),
            static_url_path='/static')
+app.json = OrjsonProvider(app)
+
+# Compress JSON and HTML responses over 1 KB (brotli when the client accepts
+# it, else gzip). Streamed file downloads are passed through untouched.
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+app.config['COMPRESS_LEVEL'] = 4
+app.config['COMPRESS_BR_LEVEL'] = 4
+app.config['COMPRESS_MIN_SIZE'] = 1024
+Compress(app)
+
+# Flask-Compress appends the encoding to a compressed response's ETag
+# ("<etag>:br"), and clients send that value back in If-None-Match
+COMPRESSED_ETAG_SUFFIX = re.compile(r':(?:br|gzip|deflate)"')
 
 # Configure CORS with more restrictive settings
 CORS(app, resources={
@@ -57,7 +84,25 @@ CORS(app, resources={
     }
 })
 
-limiter = Limiter(get_remote_address, app=app, default_limits=["200 per day", "50 per hour"])
+# Rate limit counters are per process unless RATELIMIT_STORAGE_URI points at a
+# shared store (e.g. redis://host:6379/1), which keeps limits correct across workers
+RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'memory://')
+# Header carrying the real client IP when behind a trusted proxy (e.g. CF-Connecting-IP)
+RATELIMIT_CLIENT_IP_HEADER = os.getenv('RATELIMIT_CLIENT_IP_HEADER')
+
+def _client_ip_key():
+    if RATELIMIT_CLIENT_IP_HEADER:
+        client_ip = request.headers.get(RATELIMIT_CLIENT_IP_HEADER)
+        if client_ip:
+            return client_ip
+    return get_remote_address()
+
+limiter = Limiter(
+    _client_ip_key,
+    app=app,
+    default_limits=["200 per day", "50 per hour"],
+    storage_uri=RATELIMIT_STORAGE_URI
+)
 
 # Register AI routes blueprint
 app.register_blueprint(ai_bp, url_prefix='/api')
@@ -67,21 +112,191 @@ app.register_blueprint(enhanced_bp, url_prefix='/api')
 
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp(prefix='racks_')  # Root for every upload's temp directory
 app.config['SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', secrets.token_hex(32))
 app.config['SESSION_COOKIE_SECURE'] = True  # Only send cookies over HTTPS
 app.config['SESSION_COOKIE_HTTPONLY'] = True  # Prevent JavaScript access to cookies
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # CSRF protection
 ALLOWED_EXTENSIONS = {'adg', 'adv'}
+_ALLOWED_SUFFIXES = tuple('.' + ext for ext in sorted(ALLOWED_EXTENSIONS))
+# JWT signing settings, resolved once instead of per request
+JWT_SECRET_KEY = app.config['SECRET_KEY']
+JWT_ALGORITHM = 'HS256'
+JWT_ALGORITHMS = (JWT_ALGORITHM,)
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Read size for raw upload bodies
+MAX_SEARCH_BODY_SIZE = 4096  # Search/tag payloads are tiny; reject anything larger before parsing
+
+# Temp directories for pending analyses live under UPLOAD_FOLDER, one
+# per upload named by its upload_id. temp_dirs maps the opaque upload_id
+# to (temp_dir, uploaded file path, downloadable basenames) and download_dirs
+# indexes each downloadable basename to its temp_dir for O(1) download lookups.
+# The uploaded file stays here until /api/analyze/complete saves it, so the
+# client never has to send the file back.
+# Entries are bounded in number and age so abandoned uploads don't fill the
+# disk; a janitor thread expires stale entries even when no requests arrive.
+TEMP_DIRS_MAX_ENTRIES = 500
+TEMP_DIRS_TTL = 3600  # seconds
+TEMP_DIRS_JANITOR_INTERVAL = 300  # seconds
+
+def _discard_temp_dir(entry):
+    """Drop a temp_dirs entry's download index and delete it from disk"""
+    temp_dir, _, downloadable = entry
+    for download_id in downloadable:
+        app.download_dirs.pop(download_id, None)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+class TempDirCache(TTLCache):
+    """TTLCache of temp_dirs entries that deletes each directory when it is evicted or expires"""
+    
+    def popitem(self):
+        key, entry = super().popitem()
+        _discard_temp_dir(entry)
+        return key, entry
+    
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for _, entry in expired:
+            _discard_temp_dir(entry)
+        return expired
+
+app.temp_dirs = TempDirCache(maxsize=TEMP_DIRS_MAX_ENTRIES, ttl=TEMP_DIRS_TTL)
+app.download_dirs = {}
+_temp_dirs_lock = threading.Lock()
+
+_temp_dirs_janitor_pid = None
+
+def _new_upload_dir():
+    """Create the temp directory for a new upload, returning (upload_id, temp_dir)"""
+    upload_id = secrets.token_urlsafe(16)
+    temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], upload_id)
+    os.mkdir(temp_dir)
+    return upload_id, temp_dir
+
+def _temp_dirs_janitor():
+    while True:
+        time.sleep(TEMP_DIRS_JANITOR_INTERVAL)
+        try:
+            with _temp_dirs_lock:
+                app.temp_dirs.expire()
+        except Exception as e:
+            logger.error(f"Failed to expire temp directories: {e}")
+
+def _register_temp_dir(upload_id, temp_dir, filepath, downloadable):
+    """Track an upload's temp directory and the exported files that may be downloaded from it"""
+    global _temp_dirs_janitor_pid
+    with _temp_dirs_lock:
+        # Start the janitor lazily so each forked worker runs its own
+        if _temp_dirs_janitor_pid != os.getpid():
+            _temp_dirs_janitor_pid = os.getpid()
+            threading.Thread(target=_temp_dirs_janitor, name='temp-dirs-janitor', daemon=True).start()
+        app.temp_dirs[upload_id] = (temp_dir, filepath, downloadable)
+        for download_id in downloadable:
+            app.download_dirs[download_id] = temp_dir
+
+def _uploaded_file_path(upload_id):
+    """Path of the file retained for a pending upload, or None if it is unknown or expired"""
+    with _temp_dirs_lock:
+        app.temp_dirs.expire()
+        entry = app.temp_dirs.get(upload_id)
+    return entry[1] if entry is not None else None
+
+def _release_temp_dir(upload_id):
+    """Stop tracking an upload's temp directory and remove it from disk"""
+    with _temp_dirs_lock:
+        entry = app.temp_dirs.pop(upload_id, None)
+        if entry is not None:
+            _discard_temp_dir(entry)
+
+# Download counts are batched in memory and flushed to MongoDB in a single
+# bulk write every few seconds instead of one write per download
+DOWNLOAD_COUNT_FLUSH_INTERVAL = 2  # seconds
+_pending_downloads = Counter()
+_pending_downloads_lock = threading.Lock()
+_download_flusher_pid = None
+
+def _flush_download_counts():
+    """Write pending download counts, keeping any that weren't applied for the next flush"""
+    with _pending_downloads_lock:
+        pending = dict(_pending_downloads)
+        _pending_downloads.clear()
+    
+    if not pending:
+        return
+    failed = db.increment_download_counts(pending)
+    if failed:
+        with _pending_downloads_lock:
+            _pending_downloads.update(failed)
+
+def _download_count_flusher():
+    while True:
+        time.sleep(DOWNLOAD_COUNT_FLUSH_INTERVAL)
+        try:
+            _flush_download_counts()
+        except Exception as e:
+            logger.error(f"Failed to flush download counts: {e}")
+
+def _queue_download_count(rack_id):
+    """Count a download, starting this process's flusher thread on first use"""
+    global _download_flusher_pid
+    with _pending_downloads_lock:
+        _pending_downloads[rack_id] += 1
+        # Threads don't survive fork, so each server worker starts its own
+        if _download_flusher_pid != os.getpid():
+            _download_flusher_pid = os.getpid()
+            threading.Thread(target=_download_count_flusher, name='download-count-flusher', daemon=True).start()
+
+atexit.register(_flush_download_counts)
+
+# Short-lived cache of serialized list responses - these change on the order of
+# minutes, so a cache window collapses repeated polls into a single query
+LIST_CACHE_TTL = 15  # seconds
+_list_cache = TTLCache(maxsize=128, ttl=LIST_CACHE_TTL)
+_list_cache_lock = threading.Lock()
 
-# Security headers middleware
-@app.after_request
-def set_security_headers(response):
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'DENY'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
-    response.headers['Content-Security-Policy'] = (
+def cached_endpoint(f):
+    """Cache successful JSON responses keyed by path + query string"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.full_path
+        with _list_cache_lock:
+            body = _list_cache.get(key)
+        
+        if body is None:
+            rv = f(*args, **kwargs)
+            response, status = rv if isinstance(rv, tuple) else (rv, 200)
+            if status != 200:
+                return rv
+            body = response.get_data()
+            with _list_cache_lock:
+                _list_cache[key] = body
+        
+        return Response(body, mimetype='application/json',
+                        headers={'Cache-Control': f'public, max-age={LIST_CACHE_TTL}'})
+    return decorated
+
+# Users seen by token_required recently, so authenticated requests don't
+# each pay a MongoDB lookup for the same account
+USER_CACHE_TTL = 60  # seconds
+_user_cache = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+
+def _get_cached_user(user_id):
+    with _user_cache_lock:
+        user = _user_cache.get(user_id)
+    if user is None:
+        user = db.get_user_by_id(user_id)
+        if user:
+            with _user_cache_lock:
+                _user_cache[user_id] = user
+    return user
+
+# Security headers - built once and applied to every response
+_SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'X-XSS-Protection': '1; mode=block',
+    'Strict-Transport-Security': 'max-age=31536000; includeSubDomains',
+    'Content-Security-Policy': (
         "default-src 'self'; "
         "script-src 'self' 'unsafe-inline'; "  # We'll need unsafe-inline for now, can refactor later
         "style-src 'self' 'unsafe-inline'; "
@@ -89,11 +304,48 @@ def set_security_headers(response):
         "font-src 'self'; "
         "connect-src 'self'; "
         "frame-ancestors 'none';"
-    )
-    return response
+    ),
+}
+_SECURITY_HEADER_ITEMS = list(_SECURITY_HEADERS.items())
+_SECURITY_HEADER_NAMES = frozenset(name.lower() for name in _SECURITY_HEADERS)
+
+def _security_headers_middleware(wsgi_app):
+    """
+    WSGI middleware appending the prebuilt security headers to every
+    response, including error responses that bypass after_request handlers
+    """
+    def middleware(environ, start_response):
+        def start_response_with_headers(status, headers, exc_info=None):
+            headers = [header for header in headers if header[0].lower() not in _SECURITY_HEADER_NAMES]
+            headers.extend(_SECURITY_HEADER_ITEMS)
+            return start_response(status, headers, exc_info)
+        return wsgi_app(environ, start_response_with_headers)
+    return middleware
+
+app.wsgi_app = _security_headers_middleware(app.wsgi_app)
+
+_MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+def _get_request_data():
+    """
+    Parse the request body as JSON (via the app's orjson provider) or, for
+    clients that send it, MessagePack. The raw body isn't kept on the request
+    after parsing. Returns {} for a missing or malformed body.
+    """
+    raw = request.get_data(cache=False)
+    if not raw:
+        return {}
+    try:
+        if request.mimetype in _MSGPACK_MIMETYPES:
+            data = msgpack.unpackb(raw, raw=False)
+        else:
+            data = app.json.loads(raw)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(_ALLOWED_SUFFIXES)
 
 # Authentication decorator
 def token_required(f):
@@ -118,10 +370,10 @@ def token_required(f):
             return jsonify({'error': 'Token is missing'}), 401
 
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+            data = jwt.decode(token, JWT_SECRET_KEY, algorithms=JWT_ALGORITHMS)
             logger.info(f"token_required: Decoded JWT payload: {data}")
             current_user_id = data['user_id']
-            current_user = db.get_user_by_id(current_user_id)
+            current_user = _get_cached_user(current_user_id)
             if not current_user:
                 logger.warning("token_required: No user found for user_id in token.")
                 return jsonify({'error': 'Invalid token'}), 401
@@ -138,18 +390,58 @@ def token_required(f):
         return f(current_user, *args, **kwargs)
     return decorated
 
+# Built frontend, listed once at startup: asset lookups are a set membership
+# test, with no stat per request and no way to reach files outside the build
+FRONTEND_DIR = os.path.join(backend_root, 'static', 'frontend')
+FRONTEND_ASSETS_MAX_AGE = 31536000  # Vite's assets/ filenames are content-hashed
+
+def _list_frontend_files():
+    files = set()
+    for root, _dirs, names in os.walk(FRONTEND_DIR):
+        rel_root = os.path.relpath(root, FRONTEND_DIR).replace(os.sep, '/')
+        for name in names:
+            files.add(name if rel_root == '.' else f"{rel_root}/{name}")
+    return frozenset(files)
+
+FRONTEND_FILES = _list_frontend_files()
+
+def _send_frontend_file(path):
+    if path.startswith('assets/'):
+        response = send_from_directory(FRONTEND_DIR, path, conditional=True, max_age=FRONTEND_ASSETS_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+    return send_from_directory(FRONTEND_DIR, path, conditional=True)
+
+@lru_cache(maxsize=1)
+def _index_html():
+    """index.html and its ETag, read once - it is the fallback for every client-side route"""
+    with open(os.path.join(FRONTEND_DIR, 'index.html'), 'rb') as f:
+        body = f.read()
+    return body, hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def _index_response():
+    body, etag = _index_html()
+    response = app.response_class(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(_without_compressed_etags(request.environ))
+
+def _without_compressed_etags(environ):
+    """The request environ with Flask-Compress's encoding suffix stripped from If-None-Match"""
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return environ
+    return {**environ, 'HTTP_IF_NONE_MATCH': COMPRESSED_ETAG_SUFFIX.sub('"', if_none_match)}
+
 @app.route('/')
 def home():
     """Serve React frontend"""
     try:
-        index_path = os.path.join(backend_root, 'static', 'frontend', 'index.html')
-        logger.info(f"Attempting to serve index.html from: {index_path}")
-        logger.info(f"File exists: {os.path.exists(index_path)}")
-        logger.info(f"Project root: {project_root}")
-        if not os.path.exists(index_path):
+        if 'index.html' not in FRONTEND_FILES:
+            index_path = os.path.join(FRONTEND_DIR, 'index.html')
             logger.error(f"index.html not found at {index_path}")
-            return jsonify({"error": "Frontend not found", "path": str(index_path)}), 500
-        return send_file(index_path)
+            return jsonify({"error": "Frontend not found", "path": index_path}), 500
+        return _index_response()
     except Exception as e:
         logger.error(f"Error serving frontend: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -162,12 +454,11 @@ def serve_frontend(path):
         return {'error': 'API endpoint not found'}, 404
     
     # Try to serve static assets first
-    static_file_path = os.path.join(backend_root, 'static', 'frontend', path)
-    if os.path.exists(static_file_path) and os.path.isfile(static_file_path):
-        return send_file(static_file_path)
+    if path in FRONTEND_FILES:
+        return _send_frontend_file(path)
     
     # For client-side routing, serve index.html
-    return send_file(os.path.join(backend_root, 'static', 'frontend', 'index.html'))
+    return _index_response()
 
 @app.route('/test_visualization.html')
 def test_visualization():
@@ -207,6 +498,7 @@ def get_user_favorites(current_user):
     return jsonify({'success': True, 'favorites': favorites})
 
 @app.route('/api/racks/popular', methods=['GET'])
+@cached_endpoint
 def get_popular_racks():
     """Get most downloaded racks"""
     try:
@@ -245,12 +537,86 @@ def serve_upload():
     """Serve the upload page"""
     return render_template('upload.html')
 
+# The health payload never changes, so it is serialized once at import
+_HEALTH_BODY = json.dumps({'status': 'healthy', 'message': 'Ableton Rack Analyzer API is running', 'timestamp': '2025-08-04'})
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'message': 'Ableton Rack Analyzer API is running', 'timestamp': '2025-08-04'})
+    return Response(_HEALTH_BODY, mimetype='application/json', headers={'Cache-Control': 'max-age=10'})
+
+# Rack analysis and exports (gzip, XML parsing and serialization) are
+# CPU-bound, so they run in a process pool: under gevent workers they would
+# otherwise stall every other request on the worker's event loop. The pool is
+# created on first use so each server worker process gets its own.
+# gunicorn already runs about two workers per core (gunicorn.conf.py), so one
+# analysis process per worker covers every core; ANALYSIS_WORKERS raises it.
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', '1'))
+_analysis_pool = None
+_analysis_pool_lock = threading.Lock()
+
+def _get_analysis_pool():
+    global _analysis_pool
+    with _analysis_pool_lock:
+        if _analysis_pool is None:
+            # spawn rather than fork: the server process runs request threads
+            _analysis_pool = ProcessPoolExecutor(
+                max_workers=ANALYSIS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _analysis_pool
+
+def _analyze_in_pool(filepath, filename, temp_dir, verbose):
+    """Run analyze_and_export_rack_file in the analysis pool, replacing the pool if a worker died"""
+    global _analysis_pool
+    pool = _get_analysis_pool()
+    try:
+        return pool.submit(analyze_and_export_rack_file, filepath, filename, temp_dir, verbose).result()
+    except BrokenProcessPool:
+        with _analysis_pool_lock:
+            if _analysis_pool is pool:
+                _analysis_pool = None
+        raise
+
+def _analyze_uploaded_file(upload_id, filename, filepath, temp_dir):
+    """Analyze a rack file already written to filepath and build the initial analysis response"""
+    # Analyze the rack and export its XML and JSON (enable verbose in debug mode)
+    verbose_parsing = app.debug or os.getenv('FLASK_ENV') == 'development'
+    result = _analyze_in_pool(filepath, filename, temp_dir, verbose_parsing)
+    if result is None:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return jsonify({'error': 'Failed to decompress or parse the file'}), 500
+    
+    rack_info = result['rack_info']
+    if rack_info is None:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return jsonify({'error': 'Failed to analyze the rack structure'}), 500
+    
+    xml_path = result['xml_path']
+    json_path = result['json_path']
+    
+    # Keep the upload on the server for /api/analyze/complete, along with the
+    # exact filenames that may be downloaded from its temp directory
+    downloadable = {os.path.basename(p) for p in (xml_path, json_path) if p}
+    _register_temp_dir(upload_id, temp_dir, filepath, downloadable)
+    
+    # Prepare response without saving
+    response_data = {
+        'success': True,
+        'analysis': rack_info,
+        'filename': filename,
+        'upload_id': upload_id,  # Pass back to /api/analyze/complete
+        'stats': rack_info['stats'],
+        'download_ids': {
+            'xml': os.path.basename(xml_path) if xml_path else None,
+            'json': os.path.basename(json_path) if json_path else None
+        }
+    }
+    
+    return jsonify(response_data), 200
 
 @app.route('/api/analyze', methods=['POST'])
+@limiter.limit("10 per hour")
 def analyze_rack_initial():
     """Perform initial analysis of an uploaded Ableton rack file without saving"""
     try:
@@ -269,59 +635,63 @@ def analyze_rack_initial():
             return jsonify({'error': 'Invalid file type. Only .adg and .adv files are allowed'}), 400
         
         # Create a temporary directory for this request
-        temp_dir = tempfile.mkdtemp()
+        upload_id, temp_dir = _new_upload_dir()
         
         try:
-            # Save the uploaded file
             filename = secure_filename(file.filename)
             filepath = os.path.join(temp_dir, filename)
             file.save(filepath)
             
-            # Analyze the rack
-            xml_root = decompress_and_parse_ableton_file(filepath)
-            if xml_root is None:
-                return jsonify({'error': 'Failed to decompress or parse the file'}), 500
-            
-            # Parse chains and devices (enable verbose in debug mode)
-            verbose_parsing = app.debug or os.getenv('FLASK_ENV') == 'development'
-            rack_info = parse_chains_and_devices(xml_root, filename, verbose=verbose_parsing)
-            if rack_info is None:
-                return jsonify({'error': 'Failed to analyze the rack structure'}), 500
+            return _analyze_uploaded_file(upload_id, filename, filepath, temp_dir)
             
-            # Export XML and JSON files
-            xml_path = export_xml_to_file(xml_root, filepath, temp_dir)
-            json_path = export_analysis_to_json(rack_info, filepath, temp_dir)
+        except Exception as e:
+            # Cleanup on error
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
             
-            # Read file content and encode as base64 for client storage
-            import base64
-            with open(filepath, 'rb') as f:
-                file_content = f.read()
-            file_content_b64 = base64.b64encode(file_content).decode('utf-8')
+    except Exception as e:
+        return jsonify({'error': f'Request failed: {str(e)}'}), 500
+
+@app.route('/api/analyze/stream', methods=['POST'])
+@limiter.limit("10 per hour")
+def analyze_rack_stream():
+    """
+    Same as /api/analyze for a rack file sent as a raw application/octet-stream
+    body, named by the X-Filename header or ?filename=. The body is copied
+    straight to disk, skipping multipart form parsing.
+    """
+    try:
+        if request.mimetype != 'application/octet-stream':
+            return jsonify({'error': 'Content-Type must be application/octet-stream'}), 415
+        
+        original_filename = request.headers.get('X-Filename') or request.args.get('filename', '')
+        if not original_filename:
+            return jsonify({'error': 'No filename provided'}), 400
+        
+        # Validate file type
+        if not allowed_file(original_filename):
+            return jsonify({'error': 'Invalid file type. Only .adg and .adv files are allowed'}), 400
+        
+        # Create a temporary directory for this request
+        upload_id, temp_dir = _new_upload_dir()
+        
+        try:
+            filename = secure_filename(original_filename)
+            filepath = os.path.join(temp_dir, filename)
             
-            # Prepare response without saving
-            response_data = {
-                'success': True,
-                'analysis': rack_info,
-                'filename': filename,
-                'file_content': file_content_b64,  # Include for client-side storage
-                'stats': {
-                    'total_chains': len(rack_info.get('chains', [])),
-                    'total_devices': sum(len(chain.get('devices', [])) for chain in rack_info.get('chains', [])),
-                    'macro_controls': len(rack_info.get('macro_controls', []))
-                },
-                'download_ids': {
-                    'xml': os.path.basename(xml_path) if xml_path else None,
-                    'json': os.path.basename(json_path) if json_path else None
-                }
-            }
+            # request.stream is capped at MAX_CONTENT_LENGTH
+            with open(filepath, 'wb') as f:
+                shutil.copyfileobj(request.stream, f, UPLOAD_CHUNK_SIZE)
             
-            # Store temp directory in app context
-            if not hasattr(app, 'temp_dirs'):
-                app.temp_dirs = {}
-            app.temp_dirs[filename] = temp_dir
+            if not os.path.getsize(filepath):
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                return jsonify({'error': 'No file provided'}), 400
             
-            return jsonify(response_data), 200
+            return _analyze_uploaded_file(upload_id, filename, filepath, temp_dir)
             
+        except RequestEntityTooLarge:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return jsonify({'error': 'File too large. Maximum size is 16MB.'}), 413
         except Exception as e:
             # Cleanup on error
             shutil.rmtree(temp_dir, ignore_errors=True)
@@ -335,12 +705,23 @@ def analyze_rack_initial():
 def complete_analysis(current_user):
     """Complete the analysis by saving metadata after initial analysis"""
     try:
-        data = request.get_json()
+        data = _get_request_data()
         rack_info = data.get('analysis')
         filename = data.get('filename', 'unknown')
         user_info = data.get('user_info', {})
+        upload_id = data.get('upload_id')
         file_content_b64 = data.get('file_content')
         
+        # Read the file retained by /api/analyze; clients that don't send an
+        # upload_id may still send the file back base64 encoded
+        if upload_id:
+            uploaded_path = _uploaded_file_path(upload_id)
+            if not uploaded_path:
+                return jsonify({'error': 'Upload expired or not found. Please upload the file again'}), 404
+            file_content = Path(uploaded_path).read_bytes()
+        else:
+            file_content = a2b_base64(file_content_b64) if file_content_b64 else b''
+        
         # Include user info in rack_info
         rack_info['user_info'] = {
             'producer_name': current_user.get('username'),
@@ -377,18 +758,13 @@ def complete_analysis(current_user):
         
         # Save to MongoDB
         try:
-            # Decode base64 file content
-            import base64
-            file_content = base64.b64decode(file_content_b64) if file_content_b64 else b''
-            
             rack_id = db.save_rack_analysis(rack_info, filename, file_content, user_id=current_user['_id'])
             if rack_id:
                 logger.info(f"Saved rack analysis to MongoDB with ID: {rack_id}")
                 
-                # Clean up temp directory if it exists
-                if hasattr(app, 'temp_dirs') and filename in app.temp_dirs:
-                    shutil.rmtree(app.temp_dirs[filename], ignore_errors=True)
-                    del app.temp_dirs[filename]
+                # Clean up the pending upload's temp directory
+                if upload_id:
+                    _release_temp_dir(upload_id)
             else:
                 logger.warning("Failed to save rack analysis to MongoDB")
                 return jsonify({'error': 'Failed to save analysis'}), 500
@@ -396,28 +772,16 @@ def complete_analysis(current_user):
             logger.error(f"Error saving to MongoDB: {str(e)}")
             return jsonify({'error': f'Failed to save analysis: {str(e)}'}), 500
         
-        # Initiate AI analysis automatically
-        try:
-            analyzer = RackAIAnalyzer()
-            analysis_result = analyzer.analyze_rack(rack_id)
-            if 'error' in analysis_result:
-                logger.warning(f"AI analysis failed for rack {rack_id}: {analysis_result['error']}")
-                # Don't fail the whole operation if AI analysis fails
-                analysis_result = None
-            else:
-                logger.info(f"AI analysis complete for rack {rack_id}")
-                # Save AI analysis to the rack document
-                db.update_rack_ai_analysis(rack_id, analysis_result)
-        except Exception as ai_error:
-            logger.error(f"AI analysis error for rack {rack_id}: {str(ai_error)}")
-            analysis_result = None
+        # Initiate AI analysis automatically in the background; the result is
+        # saved to the rack and can be fetched from /api/racks/<rack_id>
+        submit_ai_analysis(rack_id)
         
         # Vector storage removed - no longer storing embeddings
         
         return jsonify({
             'success': True, 
             'rack_id': rack_id, 
-            'ai_analysis': analysis_result
+            'ai_analysis': 'pending'
         }), 200
         
     except Exception as e:
@@ -427,25 +791,33 @@ def complete_analysis(current_user):
 def download_file(file_type, filename):
     """Download generated XML or JSON files"""
     try:
-        # Security check
-        filename = secure_filename(filename)
-        
-        # Find the temp directory
-        base_filename = filename.replace('.xml', '').replace('_analysis.json', '')
-        for key in getattr(app, 'temp_dirs', {}):
-            if base_filename in key:
-                temp_dir = app.temp_dirs[key]
-                filepath = os.path.join(temp_dir, filename)
-                
-                if os.path.exists(filepath):
-                    return send_file(filepath, as_attachment=True, download_name=filename)
+        # Only serve exact filenames recorded at analysis time - no path
+        # manipulation of the client-supplied name is needed
+        with _temp_dirs_lock:
+            app.temp_dirs.expire()
+            temp_dir = app.download_dirs.get(filename)
+        
+        if temp_dir:
+            # send_file stats the path once for size, mtime and ETag; a
+            # missing file surfaces as FileNotFoundError instead of a
+            # separate exists/getmtime check
+            return send_file(
+                f'{temp_dir}/{filename}',
+                as_attachment=True,
+                download_name=filename,
+                conditional=True,
+                etag=True
+            )
         
         return jsonify({'error': 'File not found'}), 404
         
+    except FileNotFoundError:
+        return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         return jsonify({'error': f'Download failed: {str(e)}'}), 500
 
 @app.route('/api/racks', methods=['GET'])
+@cached_endpoint
 def get_recent_racks():
     """Get recently analyzed racks from MongoDB"""
     try:
@@ -463,8 +835,6 @@ def get_recent_racks():
 def get_rack_by_id(rack_id):
     """Get a specific rack analysis by ID"""
     try:
-        from bson import ObjectId
-        
         # Validate rack_id parameter
         if not rack_id or rack_id in ['undefined', 'null', 'None']:
             return jsonify({'error': 'Invalid rack ID provided'}), 400
@@ -474,10 +844,17 @@ def get_rack_by_id(rack_id):
         
         rack = db.get_rack_analysis(rack_id)
         if rack:
-            return jsonify({
+            # Revalidated rather than cached in the process: every request
+            # still reads the rack, so a comment, rating or ownership change
+            # made through any worker shows up at once, but an unchanged rack
+            # is answered with a 304 instead of its body
+            response = jsonify({
                 'success': True,
                 'rack': rack
-            }), 200
+            })
+            response.add_etag()
+            response.cache_control.no_cache = True
+            return response.make_conditional(_without_compressed_etags(request.environ))
         else:
             return jsonify({'error': 'Rack not found'}), 404
     except Exception as e:
@@ -502,27 +879,19 @@ def search_racks():
                 'query': query
             }), 200
         else:  # POST
-            data = request.get_json()
+            if request.content_length and request.content_length > MAX_SEARCH_BODY_SIZE:
+                return jsonify({'error': 'Search request too large'}), 413
+            
+            data = _get_request_data()
             query = data.get('query', '')
             tags = data.get('tags', [])
             
             if not query and not tags:
                 return jsonify({'error': 'Either query or tags required'}), 400
             
-            # If we have both query and tags, we need to combine the results
+            # If we have both query and tags, match racks satisfying both in one query
             if query and tags:
-                # Get text search results
-                text_results = db.search_racks(query)
-                # Get tag search results
-                tag_results = db.search_by_tags(tags)
-                
-                # Find intersection (racks that match both criteria)
-                text_ids = {str(r['_id']) for r in text_results}
-                tag_ids = {str(r['_id']) for r in tag_results}
-                matching_ids = text_ids.intersection(tag_ids)
-                
-                # Filter to only matching racks
-                racks = [r for r in text_results if str(r['_id']) in matching_ids]
+                racks = db.search_racks_with_tags(query, tags)
             elif query:
                 racks = db.search_racks(query)
             else:  # tags only
@@ -539,6 +908,7 @@ def search_racks():
         return jsonify({'error': f'Search failed: {str(e)}'}), 500
 
 @app.route('/api/tags/popular', methods=['GET'])
+@cached_endpoint
 def get_popular_tags():
     """Get popular tags for auto-suggestions"""
     try:
@@ -551,7 +921,10 @@ def get_popular_tags():
 def search_by_tags():
     """Search racks by tags"""
     try:
-        data = request.get_json()
+        if request.content_length and request.content_length > MAX_SEARCH_BODY_SIZE:
+            return jsonify({'error': 'Tag search request too large'}), 413
+        
+        data = _get_request_data()
         tags = data.get('tags', [])
         
         if not tags:
@@ -571,8 +944,6 @@ def search_by_tags():
 def download_rack_file(rack_id):
     """Download the original .adg file for a rack"""
     try:
-        from bson import ObjectId
-        
         # Validate rack_id parameter
         if not rack_id or rack_id in ['undefined', 'null', 'None']:
             return jsonify({'error': 'Invalid rack ID provided'}), 400
@@ -580,34 +951,33 @@ def download_rack_file(rack_id):
         if not ObjectId.is_valid(rack_id):
             return jsonify({'error': 'Invalid rack ID format'}), 400
         
-        # Increment download count
-        db.increment_download_count(rack_id)
-        
-        # Get rack from database
-        rack = db.get_rack_analysis(rack_id)
+        # Get the rack's original file (streamed from GridFS)
+        rack = db.get_rack_file(rack_id)
         if not rack:
             return jsonify({'error': 'Rack not found'}), 404
         
-        # Check if file content exists
-        if 'file_content' not in rack:
+        if rack['file'] is None:
             return jsonify({'error': 'Original file not available'}), 404
         
-        # Decode the base64 content
-        import base64
-        file_content = base64.b64decode(rack['file_content'])
-        
-        # Get the original filename
-        filename = rack.get('filename', 'rack.adg')
-        
-        # Create a temporary file
-        import io
-        return send_file(
-            io.BytesIO(file_content),
+        # The stored file never changes for a given rack, so the rack ID is a
+        # stable ETag and repeat downloads can be answered with a 304
+        response = send_file(
+            rack['file'],
             mimetype='application/octet-stream',
             as_attachment=True,
-            download_name=filename
+            download_name=rack['filename'],
+            conditional=True,
+            etag=rack['_id'],
+            last_modified=rack.get('created_at')
         )
         
+        # Count the download (not revalidations); the write is batched off
+        # the request path
+        if response.status_code != 304:
+            _queue_download_count(rack_id)
+        
+        return response
+        
     except Exception as e:
         logger.error(f"Failed to download rack file: {e}")
         return jsonify({'error': f'Download failed: {str(e)}'}), 500
@@ -616,10 +986,11 @@ def download_rack_file(rack_id):
 def cleanup():
     """Clean up temporary files"""
     try:
-        # Clean up all temp directories
-        for temp_dir in getattr(app, 'temp_dirs', {}).values():
-            shutil.rmtree(temp_dir, ignore_errors=True)
-        app.temp_dirs = {}
+        # Clean up all temp directories (eviction removes each one from disk)
+        with _temp_dirs_lock:
+            app.temp_dirs.expire()
+            while app.temp_dirs:
+                app.temp_dirs.popitem()
         
         return jsonify({'success': True, 'message': 'Cleanup completed'}), 200
         
@@ -632,7 +1003,7 @@ def cleanup():
 def register():
     """Register a new user"""
     try:
-        data = request.get_json()
+        data = _get_request_data()
         
         # Validate input
         username = sanitize_username(data.get('username', '').strip())
@@ -657,11 +1028,10 @@ def register():
             return jsonify({'error': 'Username or email already exists'}), 409
         
         # Create JWT token
-        from datetime import datetime, timedelta
         token = jwt.encode({
             'user_id': user_id,
             'exp': datetime.utcnow() + timedelta(days=7)
-        }, app.config['SECRET_KEY'], algorithm='HS256')
+        }, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
         
         return jsonify({
             'success': True,
@@ -682,7 +1052,7 @@ def register():
 def login():
     """Login user"""
     try:
-        data = request.get_json()
+        data = _get_request_data()
         
         username = data.get('username', '').strip()
         password = data.get('password', '')
@@ -697,11 +1067,10 @@ def login():
             return jsonify({'error': 'Invalid username or password'}), 401
         
         # Create JWT token
-        from datetime import datetime, timedelta
         token = jwt.encode({
             'user_id': user['_id'],
             'exp': datetime.utcnow() + timedelta(days=7)
-        }, app.config['SECRET_KEY'], algorithm='HS256')
+        }, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
         
         return jsonify({
             'success': True,
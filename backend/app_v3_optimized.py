@@ -22,6 +22,7 @@ import secrets
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from security import validate_password, validate_email, sanitize_username
+from json_provider import OrjsonProvider
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -45,6 +46,7 @@ app = Flask(__name__,
            template_folder=str(project_root / 'templates'),
            static_folder=str(project_root / 'static'),
            static_url_path='/static')
+app.json = OrjsonProvider(app)
 
 # Configure CORS
 CORS(app, resources={
@@ -449,28 +451,20 @@ def download_rack(rack_id):
         if not ObjectId.is_valid(rack_id):
             return jsonify({'error': 'Invalid rack ID'}), 400
         
-        # Get rack data
-        rack_data = db.get_rack_with_full_data(rack_id)
+        # Get the rack's original file (streamed from GridFS, no decoding or
+        # temporary copy)
+        rack = db.get_rack_file(rack_id)
         
-        if not rack_data or 'file_content' not in rack_data:
+        if not rack or rack['file'] is None:
             return jsonify({'error': 'Rack file not available'}), 404
         
         # Increment download count atomically
         db.increment_download_count(rack_id)
         
-        # Prepare file for download
-        import base64
-        file_content = base64.b64decode(rack_data['file_content'].encode('utf-8'))
-        
-        # Create temporary file
-        temp_path = os.path.join(tempfile.gettempdir(), f"{rack_data['filename']}")
-        with open(temp_path, 'wb') as f:
-            f.write(file_content)
-        
         return send_file(
-            temp_path,
+            rack['file'],
             as_attachment=True,
-            download_name=rack_data['filename'],
+            download_name=rack['filename'],
             mimetype='application/octet-stream'
         )
         
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Bulk import Ableton rack files (.adg/.adv) from folders into the v3 database
+
+Usage: python bulk_import.py <folder> [<folder> ...]
+"""
+
+import os
+import sys
+import logging
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from abletonRackAnalyzer import analyze_rack_file
+from db_v3_optimized import db_v3 as db, SAVE_BATCH_SIZE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RACK_EXTENSIONS = ('.adg', '.adv')
+
+def find_rack_files(folders):
+    """Paths of every rack file under the given folders, in a stable order"""
+    paths = []
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(RACK_EXTENSIONS))
+    return sorted(paths)
+
+def _analyze(path):
+    """save_rack_analyses arguments for one rack file, or None if it can't be analyzed"""
+    filename = os.path.basename(path)
+    try:
+        rack_info = analyze_rack_file(path, filename)
+        if not rack_info:
+            logger.error(f"Could not analyze {path}")
+            return None
+        with open(path, 'rb') as f:
+            return {'rack_info': rack_info, 'filename': filename, 'file_content': f.read()}
+    except Exception as e:
+        logger.error(f"Failed to analyze {path}: {e}")
+        return None
+
+def bulk_import(folders):
+    """Analyze and save every rack file under folders, SAVE_BATCH_SIZE racks per write"""
+    if not db.connect():
+        logger.error("Failed to connect to database")
+        return False
+
+    paths = find_rack_files(folders)
+    logger.info(f"Found {len(paths)} rack files")
+
+    saved = 0
+    for start in range(0, len(paths), SAVE_BATCH_SIZE):
+        racks = [rack for rack in map(_analyze, paths[start:start + SAVE_BATCH_SIZE]) if rack]
+        if racks:
+            saved += sum(rack_id is not None for rack_id in db.save_rack_analyses(racks))
+
+    logger.info(f"Imported {saved} of {len(paths)} rack files")
+    return saved == len(paths)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        sys.exit(2)
+    sys.exit(0 if bulk_import(sys.argv[1:]) else 1)
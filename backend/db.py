@@ -3,26 +3,214 @@ MongoDB connection and operations for Ableton Rack Analyzer
 """
 
 import os
+import io
+import re
+import time
+from binascii import a2b_base64
 from datetime import datetime
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+import pymongo
+from pymongo import IndexModel, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
+import gridfs
 import logging
+import threading
 import bcrypt
 from bson import ObjectId
-import base64
+from bson.codec_options import CodecOptions, TypeDecoder, TypeRegistry
+from abletonRackAnalyzer import count_devices, iter_devices, summarize_rack
+from db_utils import QUERY_MAX_TIME_MS, one_batch
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Connection pool sizing - the module-level db instance owns the only client,
+# shared by every request handler and blueprint, so the pool must be large
+# enough for the worker's concurrency
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '200'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '10'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 2000
+MONGO_WAIT_QUEUE_TIMEOUT_MS = 2500  # Fail fast instead of queueing when the pool is exhausted
+# Close pooled connections idle this long, so a quiet worker drifts back to
+# minPoolSize instead of holding burst-sized pools open
+MONGO_MAX_IDLE_TIME_MS = 300000
+# Bound how long a request can hang on an unreachable or stalled server
+MONGO_CONNECT_TIMEOUT_MS = 2000
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '5000'))
+# Index builds and backfills run once per process inside connect(). They get
+# this budget instead of the per-request socket timeout above
+MONGO_SCHEMA_TIMEOUT_MS = int(os.getenv('MONGO_SCHEMA_TIMEOUT_MS', '600000'))
+# Wire compression for the text-heavy list/search results; pymongo skips zstd
+# (with a warning) if the zstandard package is missing and falls back to zlib
+MONGO_COMPRESSORS = 'zstd,zlib'
+
+# Original rack files live in GridFS; rack documents keep only the file_id.
+# Read queries exclude the file fields so listings never pull file bytes.
+RACK_FILE_FIELDS_PROJECTION = {'file_content': 0, 'file_id': 0}
+# rack_name_lower only backs prefix search, so no read returns it
+RACK_DETAIL_PROJECTION = {**RACK_FILE_FIELDS_PROJECTION, 'rack_name_lower': 0}
+# List queries also drop the full nested analysis; rack cards only need the
+# precomputed stats, and the analysis is fetched per rack by get_rack_analysis
+RACK_LIST_PROJECTION = {**RACK_DETAIL_PROJECTION, 'analysis': 0}
+
+# Weighted text index backing rack search, ranked by text score. Rack names
+# count most, then tags, producer, description and filename; the metadata
+# fields have the default weight of 1.
+RACK_TEXT_INDEX = 'rack_text_idx'
+RACK_TEXT_FIELDS = (
+    'rack_name', 'filename', 'producer_name', 'description', 'tags',
+    'metadata.title', 'metadata.description', 'tags.user_tags'
+)
+RACK_TEXT_WEIGHTS = {
+    'rack_name': 10, 'tags': 8, 'tags.user_tags': 8, 'producer_name': 5,
+    'description': 3, 'filename': 2
+}
+SEARCH_RESULTS_LIMIT = 50
+# A quoted query ending in * ("Bass*") asks for rack names starting with the
+# text, which the text index can't express since it only matches whole stems.
+# It runs as an anchored, case-sensitive regex on the lowercased name so the
+# rack_name_lower index answers it with a range scan.
+QUOTED_PREFIX_QUERY = re.compile(r'^"(.+)\*"$')
+# Racks updated per bulk_write when backfilling a derived field
+BACKFILL_BATCH_SIZE = 1000
+
+
+class _ObjectIdAsStr(TypeDecoder):
+    """Decode ObjectIds straight to their hex string"""
+    bson_type = ObjectId
+    
+    def transform_bson(self, value):
+        return str(value)
+
+
+# Rack lists are read through a view of the racks collection that decodes
+# ObjectIds as strings, so results go out as-is instead of each document's
+# _id being rewritten after decoding. Queries still encode ObjectIds normally.
+# This applies to every ObjectId in the document, not just _id: nested
+# references such as user_id and rack_id also come back as strings, which is
+# intended - the JSON responses carry them as strings either way.
+LIST_CODEC_OPTIONS = CodecOptions(type_registry=TypeRegistry([_ObjectIdAsStr()]))
+
+# bcrypt work factor for new password hashes; existing hashes keep the cost
+# they were created with
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+
+# Popular tags shift slowly; get_popular_tags reuses its last result this long
+POPULAR_TAGS_CACHE_TTL = 60  # seconds
+
+# Indexes from earlier versions, dropped on connect: the metadata-only text
+# index (a collection can only have one), single-field indexes on fields that
+# are only ever searched, which the text index now covers, and the tags,
+# producer_name and user_id indexes replaced below
+OBSOLETE_INDEXES = (
+    'metadata.title_text_metadata.description_text_tags.user_tags_text',
+    'rack_name_1', 'filename_1', 'description_1', 'tags_1', 'producer_name_1',
+    'tags_partial', 'user_id_1'
+)
+
+# Indexes per collection, created in one create_indexes call each. connect()
+# only creates them when the stored index version differs from INDEX_VERSION,
+# so bump it whenever INDEXES or the text index definition changes.
+INDEX_VERSION = 5
+INDEXES = {
+    'racks': [
+        IndexModel('created_at'),
+        # Serves get_racks_by_producer's filter and its newest-first sort
+        IndexModel([('producer_name', 1), ('created_at', -1)]),
+        # search_by_tags' filter and newest-first sort; racks without tags
+        # stay out of the index
+        IndexModel([('tags', 1), ('created_at', -1)], name='tags_recent_partial',
+                   partialFilterExpression={'tags': {'$exists': True}}),
+        # get_user_racks' filter and newest-first sort as one index range
+        IndexModel([('user_id', 1), ('created_at', -1)], name='user_recent'),
+        # Quoted prefix search (QUOTED_PREFIX_QUERY)
+        IndexModel('rack_name_lower'),
+        IndexModel('download_count'),
+        IndexModel('rack_type'),
+        # Enhanced indexes for new metadata fields
+        IndexModel('metadata.title'),
+        IndexModel('metadata.difficulty'),
+        IndexModel('engagement.rating.average'),
+        IndexModel([('tags.user_tags', 1), ('metadata.difficulty', 1)])
+    ],
+    'favorites': [
+        IndexModel([('user_id', 1), ('rack_id', 1)], unique=True),
+        IndexModel('created_at')
+    ],
+    'comments': [
+        IndexModel('rack_id'),
+        IndexModel('user_id'),
+        IndexModel('created_at'),
+        IndexModel('parent_comment_id')
+    ],
+    'ratings': [
+        IndexModel([('user_id', 1), ('rack_id', 1)], unique=True),
+        IndexModel('rack_id'),
+        IndexModel('rating')
+    ],
+    'tag_stats': [
+        IndexModel([('count', -1)])
+    ],
+    'collections': [
+        IndexModel('user_id'),
+        IndexModel('is_public'),
+        IndexModel('created_at')
+    ],
+    'annotations': [
+        IndexModel('rack_id'),
+        IndexModel('user_id'),
+        IndexModel('component_id'),
+        IndexModel('created_at')
+    ],
+    'users': [
+        IndexModel('username', unique=True),
+        IndexModel('email', unique=True)
+    ]
+}
+
+
+def _run_blocking(func, *args):
+    """
+    Run CPU-bound C code that releases the GIL (bcrypt) on a real OS thread
+    when gevent has patched threading, so the worker's other greenlets keep
+    running meanwhile. Without gevent the caller's thread runs it directly.
+    """
+    try:
+        from gevent import get_hub, monkey
+    except ImportError:
+        return func(*args)
+    if monkey.is_module_patched('threading'):
+        return get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+
 class MongoDB:
     def __init__(self):
         self.client = None
         self.db = None
         self.collection = None
+        # self.collection with ObjectIds decoded as strings (LIST_CODEC_OPTIONS)
+        self.list_collection = None
         self.connected = False
+        # Serializes connect() so concurrent first requests share one attempt
+        self._connect_lock = threading.Lock()
+        # Set once the indexes and tag stats are in place, so reconnecting
+        # after a network blip only pays the ping
+        self._schema_ready = False
+        # (expires_at, limit, tags) of the last get_popular_tags read
+        self._popular_tags_cache = (0.0, 0, None)
         
     def connect(self):
-        """Connect to MongoDB using Railway environment variable"""
+        """Connect to MongoDB using Railway environment variable, unless already connected"""
+        # Double-checked: callers racing in while another attempt runs wait
+        # for it and reuse its result instead of pinging and indexing again
+        if self.connected:
+            return True
+        with self._connect_lock:
+            if self.connected:
+                return True
+            return self._connect()
+    
+    def _connect(self):
         try:
             # Railway provides MONGO_URL environment variable when MongoDB is attached
             mongo_url = os.getenv('MONGO_URL', os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
@@ -31,8 +219,21 @@ class MongoDB:
                 logger.warning("No MongoDB URL found in environment variables. Using local MongoDB.")
                 mongo_url = 'mongodb://localhost:27017/'
             
-            # Connect to MongoDB
-            self.client = MongoClient(mongo_url)
+            # Connect to MongoDB, reusing the pooled client across reconnect attempts
+            if self.client is None:
+                self.client = MongoClient(
+                    mongo_url,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                    retryWrites=True,
+                    compressors=MONGO_COMPRESSORS,
+                    connect=False
+                )
             
             # Test the connection
             self.client.admin.command('ping')
@@ -40,66 +241,26 @@ class MongoDB:
             # Use database
             self.db = self.client.ableton_rack_analyzer
             self.collection = self.db.racks
+            self.list_collection = self.collection.with_options(codec_options=LIST_CODEC_OPTIONS)
             self.users_collection = self.db.users
+            self.fs = gridfs.GridFS(self.db, collection='rack_files')
             
-            # Create indexes for racks - Enhanced for PRD requirements
-            self.collection.create_index('filename')
-            self.collection.create_index('created_at')
-            self.collection.create_index('rack_name')
-            self.collection.create_index('producer_name')
-            self.collection.create_index('description')
-            self.collection.create_index('tags')
-            self.collection.create_index('user_id')
-            self.collection.create_index('download_count')
-            self.collection.create_index('rack_type')
-            
-            # Enhanced indexes for new metadata fields
-            self.collection.create_index('metadata.title')
-            self.collection.create_index('metadata.difficulty')
-            self.collection.create_index('engagement.rating.average')
-            self.collection.create_index([('tags.user_tags', 1), ('metadata.difficulty', 1)])
-            
-            # Text search index for enhanced search
-            self.collection.create_index([
-                ('metadata.title', 'text'),
-                ('metadata.description', 'text'),
-                ('tags.user_tags', 'text')
-            ])
-            
-            # Create favorites collection
             self.favorites_collection = self.db.favorites
-            self.favorites_collection.create_index([('user_id', 1), ('rack_id', 1)], unique=True)
-            self.favorites_collection.create_index('created_at')
-            
-            # Create comments collection
             self.comments_collection = self.db.comments
-            self.comments_collection.create_index('rack_id')
-            self.comments_collection.create_index('user_id')
-            self.comments_collection.create_index('created_at')
-            self.comments_collection.create_index('parent_comment_id')
-            
-            # Create ratings collection
             self.ratings_collection = self.db.ratings
-            self.ratings_collection.create_index([('user_id', 1), ('rack_id', 1)], unique=True)
-            self.ratings_collection.create_index('rack_id')
-            self.ratings_collection.create_index('rating')
-            
-            # Create collections (playlists) collection
             self.collections_collection = self.db.collections
-            self.collections_collection.create_index('user_id')
-            self.collections_collection.create_index('is_public')
-            self.collections_collection.create_index('created_at')
-            
-            # Create annotations collection
             self.annotations_collection = self.db.annotations
-            self.annotations_collection.create_index('rack_id')
-            self.annotations_collection.create_index('user_id')
-            self.annotations_collection.create_index('component_id')
-            self.annotations_collection.create_index('created_at')
+            self.tag_stats_collection = self.db.tag_stats
             
-            # Create indexes for users
-            self.users_collection.create_index('username', unique=True)
-            self.users_collection.create_index('email', unique=True)
+            if not self._schema_ready:
+                with pymongo.timeout(MONGO_SCHEMA_TIMEOUT_MS / 1000):
+                    self._ensure_indexes()
+                    
+                    # Materialized tag usage counts backing get_popular_tags, kept up
+                    # to date on save and rebuilt from the racks if missing
+                    if self.tag_stats_collection.estimated_document_count() == 0:
+                        self.rebuild_tag_stats()
+                self._schema_ready = True
             
             self.connected = True
             logger.info("Successfully connected to MongoDB")
@@ -125,14 +286,12 @@ class MongoDB:
             document = {
                 'filename': filename,
                 'rack_name': rack_info.get('rack_name', 'Unknown'),
+                'rack_name_lower': rack_info.get('rack_name', 'Unknown').lower(),
                 'rack_type': rack_info.get('rack_type', 'Unknown'),  # Add rack type from analyzer
                 'analysis': rack_info,
                 'created_at': datetime.utcnow(),
-                'stats': {
-                    'total_chains': len(rack_info.get('chains', [])),
-                    'total_devices': self._count_all_devices(rack_info.get('chains', [])),
-                    'macro_controls': len(rack_info.get('macro_controls', []))
-                }
+                # Recomputed here: rack_info comes from the client on save
+                'stats': summarize_rack(rack_info)
             }
             
             # Enhanced metadata structure
@@ -219,14 +378,21 @@ class MongoDB:
             if user_id:
                 document['user_id'] = user_id
             
-            # Optionally store the original file content (base64 encoded)
+            # Optionally store the original file in GridFS, referenced by file_id
             if file_content:
-                document['file_content'] = base64.b64encode(file_content).decode('utf-8')
+                document['file_id'] = self.fs.put(file_content, filename=filename)
             
             # Insert into MongoDB
-            result = self.collection.insert_one(document)
+            try:
+                result = self.collection.insert_one(document)
+            except Exception:
+                if 'file_id' in document:
+                    self.fs.delete(document['file_id'])
+                raise
             logger.info(f"Saved enhanced rack analysis to MongoDB with ID: {result.inserted_id}")
             
+            self._increment_tag_stats(document)
+            
             return str(result.inserted_id)
             
         except Exception as e:
@@ -253,7 +419,7 @@ class MongoDB:
                 logger.error(f"Invalid ObjectId format: {rack_id}")
                 return None
                 
-            document = self.collection.find_one({'_id': ObjectId(rack_id)})
+            document = self.collection.find_one({'_id': ObjectId(rack_id)}, RACK_DETAIL_PROJECTION)
             if document:
                 document['_id'] = str(document['_id'])
             return document
@@ -264,78 +430,192 @@ class MongoDB:
             logger.error(f"Failed to get rack analysis: {e}")
             return None
     
-    def get_recent_racks(self, limit=10):
-        """Get recently analyzed racks"""
+    def get_rack_file(self, rack_id):
+        """
+        Get the original file of a rack for download.
+        Returns a dict with filename, created_at and a readable 'file' object
+        (None if the rack has no stored file), or None if the rack doesn't exist.
+        """
+        if not self.connected:
+            if not self.connect():
+                return None
+        
+        try:
+            document = self.collection.find_one(
+                {'_id': ObjectId(rack_id)},
+                {'filename': 1, 'created_at': 1, 'file_id': 1, 'file_content': 1}
+            )
+            if not document:
+                return None
+            
+            if document.get('file_id'):
+                # GridOut streams the file chunk by chunk
+                rack_file = self.fs.get(document['file_id'])
+            elif document.get('file_content'):
+                # Racks saved before GridFS embed the bytes (raw or base64 text);
+                # move them into GridFS so the next download streams too
+                file_content = document['file_content']
+                if isinstance(file_content, str):
+                    file_content = a2b_base64(file_content)
+                self._move_file_to_gridfs(document, file_content)
+                rack_file = io.BytesIO(file_content)
+            else:
+                rack_file = None
+            
+            return {
+                '_id': str(document['_id']),
+                'filename': document.get('filename', 'rack.adg'),
+                'created_at': document.get('created_at'),
+                'file': rack_file
+            }
+        except Exception as e:
+            logger.error(f"Failed to get rack file: {e}")
+            return None
+    
+    def _move_file_to_gridfs(self, document, file_content):
+        """Move a rack's embedded file_content into GridFS, leaving a file_id behind"""
+        file_id = self.fs.put(file_content, filename=document.get('filename', 'rack.adg'))
+        try:
+            # Only the first concurrent download of a legacy rack gets to migrate it
+            result = self.collection.update_one(
+                {'_id': document['_id'], 'file_id': {'$exists': False}},
+                {'$set': {'file_id': file_id}, '$unset': {'file_content': ''}}
+            )
+            if result.modified_count == 0:
+                self.fs.delete(file_id)
+        except Exception as e:
+            self.fs.delete(file_id)
+            logger.warning(f"Failed to move rack file to GridFS: {e}")
+    
+    def get_recent_racks(self, limit=10, include_analysis=False):
+        """Get recently analyzed racks, with their full analysis only if include_analysis"""
         if not self.connected:
             if not self.connect():
                 return []
         
         try:
-            cursor = self.collection.find().sort('created_at', -1).limit(limit)
-            racks = []
-            for doc in cursor:
-                doc['_id'] = str(doc['_id'])
-                racks.append(doc)
-            return racks
+            projection = RACK_DETAIL_PROJECTION if include_analysis else RACK_LIST_PROJECTION
+            cursor = one_batch(self.list_collection.find({}, projection).sort('created_at', -1), limit)
+            return list(cursor)
         except Exception as e:
             logger.error(f"Failed to get recent racks: {e}")
             return []
     
+    def _ensure_indexes(self):
+        """Create the indexes in INDEXES unless this INDEX_VERSION was already applied"""
+        marker = self.db.schema_info.find_one({'_id': 'indexes'})
+        if marker and marker.get('version') == INDEX_VERSION:
+            return
+        
+        existing = self.collection.index_information()
+        for name in OBSOLETE_INDEXES:
+            if name in existing:
+                self.collection.drop_index(name)
+        
+        for collection_name, indexes in INDEXES.items():
+            self.db[collection_name].create_indexes(indexes)
+        
+        # Text search index for rack search and enhanced search
+        self._ensure_text_index()
+        
+        self._backfill_rack_name_lower()
+        
+        self.db.schema_info.update_one(
+            {'_id': 'indexes'},
+            {'$set': {'version': INDEX_VERSION, 'updated_at': datetime.utcnow()}},
+            upsert=True
+        )
+        logger.info(f"Created MongoDB indexes (version {INDEX_VERSION})")
+    
+    def _ensure_text_index(self):
+        """Create the rack text index, dropping any text index with other weights"""
+        indexes = self.collection.index_information()
+        weights = {field: RACK_TEXT_WEIGHTS.get(field, 1) for field in RACK_TEXT_FIELDS}
+        existing = indexes.get(RACK_TEXT_INDEX)
+        if existing and dict(existing.get('weights', {})) != weights:
+            self.collection.drop_index(RACK_TEXT_INDEX)
+        
+        self.collection.create_index(
+            [(field, 'text') for field in RACK_TEXT_FIELDS],
+            weights=weights,
+            name=RACK_TEXT_INDEX
+        )
+    
+    def _backfill_rack_name_lower(self):
+        """Set rack_name_lower on racks saved before it existed"""
+        # Lowercased in Python as on save: $toLower only folds ASCII, so a
+        # server-side backfill would miss prefix searches on names like "Überbass"
+        updates = []
+        for rack in self.collection.find({'rack_name_lower': {'$exists': False}}, {'rack_name': 1}):
+            updates.append(UpdateOne(
+                {'_id': rack['_id']},
+                {'$set': {'rack_name_lower': (rack.get('rack_name') or '').lower()}}
+            ))
+            if len(updates) == BACKFILL_BATCH_SIZE:
+                self.collection.bulk_write(updates, ordered=False)
+                updates = []
+        if updates:
+            self.collection.bulk_write(updates, ordered=False)
+    
     def search_racks(self, query):
-        """Search racks by name or filename"""
+        """Search racks by name, filename, producer, description and tags, best matches first"""
         if not self.connected:
             if not self.connect():
                 return []
         
         try:
-            # Search in rack_name, filename, producer_name, and description
-            cursor = self.collection.find({
-                '$or': [
-                    {'rack_name': {'$regex': query, '$options': 'i'}},
-                    {'filename': {'$regex': query, '$options': 'i'}},
-                    {'producer_name': {'$regex': query, '$options': 'i'}},
-                    {'description': {'$regex': query, '$options': 'i'}}
-                ]
-            }).sort('created_at', -1)
-            
-            racks = []
-            for doc in cursor:
-                doc['_id'] = str(doc['_id'])
-                racks.append(doc)
-            return racks
+            cursor = self._find_search_results(query)
+            
+            return list(cursor)
         except Exception as e:
             logger.error(f"Failed to search racks: {e}")
             return []
     
-    def _count_all_devices(self, chains):
-        """Count all devices including nested ones"""
-        count = 0
-        for chain in chains:
-            for device in chain.get('devices', []):
-                count += 1
-                if 'chains' in device:
-                    count += self._count_all_devices(device['chains'])
-        return count
+    def search_racks_with_tags(self, query, tags):
+        """Search racks matching the text query that also have any of the specified tags"""
+        if not self.connected:
+            if not self.connect():
+                return []
+        
+        try:
+            # Let MongoDB intersect both criteria instead of fetching two result sets.
+            # Tags match any-of ($in) like search_by_tags, whose results this path
+            # used to intersect with; $all would silently narrow combined searches.
+            cursor = self._find_search_results(query, {'tags': {'$in': tags}})
+            
+            return list(cursor)
+        except Exception as e:
+            logger.error(f"Failed to search racks with tags: {e}")
+            return []
+    
+    def _find_search_results(self, query, extra_filter=None):
+        """Run a search, returning the top matches ranked by text score (or name for prefix queries)"""
+        prefix = QUOTED_PREFIX_QUERY.match(query)
+        if prefix:
+            search_filter = {'rack_name_lower': {'$regex': '^' + re.escape(prefix.group(1).lower())}}
+            projection = RACK_LIST_PROJECTION
+            sort = [('rack_name_lower', 1)]
+        else:
+            # Search rack_name, filename, producer_name, description and tags through
+            # the text index instead of unanchored regexes, which scan every document
+            score = {'$meta': 'textScore'}
+            search_filter = {'$text': {'$search': query}}
+            projection = {**RACK_LIST_PROJECTION, 'score': score}
+            sort = [('score', score)]
+        if extra_filter:
+            search_filter = {'$and': [search_filter, extra_filter]}
+        
+        return self.list_collection.find(search_filter, projection).sort(sort).limit(
+            SEARCH_RESULTS_LIMIT
+        ).batch_size(SEARCH_RESULTS_LIMIT).max_time_ms(QUERY_MAX_TIME_MS)
     
     def _extract_device_tags(self, rack_info):
         """Extract device names as tags for search optimization"""
         device_tags = set()
-        
-        def extract_from_chains(chains):
-            for chain in chains:
-                for device in chain.get('devices', []):
-                    device_name = device.get('name', '').strip()
-                    if device_name and device_name != 'Unknown':
-                        # Clean up device names for tags
-                        tag = device_name.lower().replace(' ', '-')
-                        device_tags.add(tag)
-                    
-                    # Recurse into nested chains
-                    if 'chains' in device:
-                        extract_from_chains(device['chains'])
-        
-        chains = rack_info.get('chains', [])
-        extract_from_chains(chains)
+        for device, _ in iter_devices(rack_info.get('chains', [])):
+            device_name = device.get('name', '').strip()
+            if device_name and device_name != 'Unknown':
+                device_tags.add(device_name.lower().replace(' ', '-'))
         return list(device_tags)
     
     def _calculate_complexity_score(self, rack_info):
@@ -347,22 +627,11 @@ class MongoDB:
             
             # Base scoring
             chain_count = len(chains)
-            device_count = self._count_all_devices(chains) + len(devices)
+            device_count = count_devices(chains) + len(devices)
             macro_count = len(macro_controls)
             
             # Calculate nesting depth
-            def max_depth(chains, current_depth=0):
-                if not chains:
-                    return current_depth
-                max_d = current_depth
-                for chain in chains:
-                    for device in chain.get('devices', []):
-                        if 'chains' in device:
-                            depth = max_depth(device['chains'], current_depth + 1)
-                            max_d = max(max_d, depth)
-                return max_d
-            
-            nesting_depth = max_depth(chains)
+            nesting_depth = max((depth + 1 for device, depth in iter_devices(chains) if 'chains' in device), default=0)
             
             # Weighted complexity score (0-100 scale)
             complexity = min(100, (
@@ -384,29 +653,62 @@ class MongoDB:
             if not self.connect():
                 return []
         
+        expires_at, cached_limit, cached = self._popular_tags_cache
+        if cached is not None and limit <= cached_limit and time.monotonic() < expires_at:
+            return cached[:limit]
+        
         try:
-            # Aggregate to count tag usage
-            pipeline = [
-                {"$unwind": "$tags"},
-                {"$group": {
-                    "_id": "$tags",
-                    "count": {"$sum": 1}
-                }},
-                {"$sort": {"count": -1}},
-                {"$limit": limit},
-                {"$project": {
-                    "name": "$_id",
-                    "count": 1,
-                    "_id": 0
-                }}
-            ]
-            
-            result = list(self.collection.aggregate(pipeline))
-            return result
+            # Read the materialized counts instead of unwinding every rack's tags
+            cursor = one_batch(self.tag_stats_collection.find({'count': {'$gt': 0}}).sort('count', -1), limit)
+            tags = [{'name': doc['_id'], 'count': doc['count']} for doc in cursor]
+            self._popular_tags_cache = (time.monotonic() + POPULAR_TAGS_CACHE_TTL, limit, tags)
+            return tags
         except Exception as e:
             logger.error(f"Failed to get popular tags: {e}")
             return []
     
+    def _increment_tag_stats(self, document):
+        """Count a newly saved rack's tags in tag_stats"""
+        tags = document.get('tags')
+        if isinstance(tags, dict):
+            tags = tags.get('user_tags')
+        tags = {tag for tag in tags or () if isinstance(tag, str) and tag}
+        if not tags:
+            return
+        
+        try:
+            self.tag_stats_collection.bulk_write([
+                UpdateOne({'_id': tag}, {'$inc': {'count': 1}}, upsert=True)
+                for tag in tags
+            ], ordered=False)
+        except Exception as e:
+            # rebuild_tag_stats corrects any drift left by a failed update
+            logger.error(f"Failed to update tag stats: {e}")
+    
+    def rebuild_tag_stats(self):
+        """Recount tag usage across all racks into tag_stats, replacing its contents"""
+        # Also called from connect() before the connection is marked ready
+        if self.db is None and not self.connect():
+            return False
+        
+        try:
+            # Legacy racks store tags as a list, newer ones under tags.user_tags.
+            # Racks without tags are skipped via the partial tags index, and
+            # only the tags reach $unwind.
+            self.collection.aggregate([
+                {"$match": {"tags": {"$exists": True, "$ne": []}}},
+                {"$project": {"tags": {"$cond": [
+                    {"$isArray": "$tags"}, "$tags", {"$ifNull": ["$tags.user_tags", []]}
+                ]}}},
+                {"$unwind": "$tags"},
+                {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
+                {"$out": "tag_stats"}
+            ], allowDiskUse=True)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to rebuild tag stats: {e}")
+            return False
+    
     def search_by_tags(self, tags):
         """Search racks that have any of the specified tags"""
         if not self.connected:
@@ -414,15 +716,11 @@ class MongoDB:
                 return []
         
         try:
-            cursor = self.collection.find({
+            cursor = self.list_collection.find({
                 'tags': {'$in': tags}
-            }).sort('created_at', -1)
+            }, RACK_LIST_PROJECTION).sort('created_at', -1)
             
-            racks = []
-            for doc in cursor:
-                doc['_id'] = str(doc['_id'])
-                racks.append(doc)
-            return racks
+            return list(cursor)
         except Exception as e:
             logger.error(f"Failed to search by tags: {e}")
             return []
@@ -443,7 +741,9 @@ class MongoDB:
         
         try:
             # Hash password
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+            password_hash = _run_blocking(
+                bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+            )
             
             # Create user document
             user_doc = {
@@ -452,8 +752,7 @@ class MongoDB:
                 'password_hash': password_hash,
                 'created_at': datetime.utcnow(),
                 'last_login': None,
-                'is_active': True,
-                'rack_count': 0
+                'is_active': True
             }
             
             # Insert user
@@ -473,19 +772,18 @@ class MongoDB:
                 return None
         
         try:
-            # Find user by username or email
-            user = self.users_collection.find_one({
-                '$or': [
-                    {'username': username.lower()},
-                    {'email': username.lower()}
-                ]
-            })
+            # Find user by username or email. Usernames can't contain '@'
+            # (sanitize_username), so one equality probe on the matching
+            # unique index does it, without planning an $or across both.
+            login = username.lower()
+            field = 'email' if '@' in login else 'username'
+            user = self.users_collection.find_one({field: login})
             
             if not user:
                 return None
             
             # Check password
-            if bcrypt.checkpw(password.encode('utf-8'), user['password_hash']):
+            if _run_blocking(bcrypt.checkpw, password.encode('utf-8'), user['password_hash']):
                 # Update last login
                 self.users_collection.update_one(
                     {'_id': user['_id']},
@@ -527,12 +825,8 @@ class MongoDB:
                 return []
         
         try:
-            cursor = self.collection.find({'user_id': user_id}).sort('created_at', -1).limit(limit)
-            racks = []
-            for doc in cursor:
-                doc['_id'] = str(doc['_id'])
-                racks.append(doc)
-            return racks
+            cursor = one_batch(self.list_collection.find({'user_id': user_id}, RACK_LIST_PROJECTION).sort('created_at', -1), limit)
+            return list(cursor)
         except Exception as e:
             logger.error(f"Failed to get user racks: {e}")
             return []
@@ -586,12 +880,8 @@ class MongoDB:
                 return []
         
         try:
-            cursor = self.collection.find({'producer_name': producer_name}).sort('created_at', -1).limit(limit)
-            racks = []
-            for doc in cursor:
-                doc['_id'] = str(doc['_id'])
-                racks.append(doc)
-            return racks
+            cursor = one_batch(self.list_collection.find({'producer_name': producer_name}, RACK_LIST_PROJECTION).sort('created_at', -1), limit)
+            return list(cursor)
         except Exception as e:
             logger.error(f"Failed to get producer racks: {e}")
             return []
@@ -603,18 +893,12 @@ class MongoDB:
                 return False
         
         try:
+            # Upload counts are derived from the racks collection (see
+            # get_user_stats_counts), so ownership is a single write.
             result = self.collection.update_one(
                 {'_id': ObjectId(rack_id)},
                 {'$set': {'user_id': user_id}}
             )
-            
-            # Update user's rack count
-            if result.modified_count > 0:
-                self.users_collection.update_one(
-                    {'_id': ObjectId(user_id)},
-                    {'$inc': {'rack_count': 1}}
-                )
-            
             return result.modified_count > 0
         except Exception as e:
             logger.error(f"Failed to update rack ownership: {e}")
@@ -636,6 +920,31 @@ class MongoDB:
             logger.error(f"Failed to increment download count: {e}")
             return False
     
+    def increment_download_counts(self, counts):
+        """
+        Apply batched download count increments ({rack_id: count}) in one bulk
+        write, returning the increments that were not applied
+        """
+        if not self.connected:
+            if not self.connect():
+                return counts
+        
+        rack_ids = list(counts)
+        try:
+            self.collection.bulk_write([
+                UpdateOne({'_id': ObjectId(rack_id)}, {'$inc': {'download_count': counts[rack_id]}})
+                for rack_id in rack_ids
+            ], ordered=False)
+            return {}
+        except BulkWriteError as e:
+            # Unordered: every update not listed in writeErrors was applied
+            failed = [rack_ids[error['index']] for error in e.details.get('writeErrors', [])]
+            logger.error(f"Failed to increment download counts of {len(failed)} racks: {e}")
+            return {rack_id: counts[rack_id] for rack_id in failed}
+        except Exception as e:
+            logger.error(f"Failed to increment download counts: {e}")
+            return counts
+    
     def get_most_downloaded_racks(self, limit=10):
         """Get most downloaded racks"""
         if not self.connected:
@@ -643,12 +952,8 @@ class MongoDB:
                 return []
         
         try:
-            cursor = self.collection.find().sort('download_count', -1).limit(limit)
-            racks = []
-            for doc in cursor:
-                doc['_id'] = str(doc['_id'])
-                racks.append(doc)
-            return racks
+            cursor = one_batch(self.list_collection.find({}, RACK_LIST_PROJECTION).sort('download_count', -1), limit)
+            return list(cursor)
         except Exception as e:
             logger.error(f"Failed to get most downloaded racks: {e}")
             return []
@@ -710,18 +1015,17 @@ class MongoDB:
         
         try:
             # Get favorite rack IDs
-            favorites = self.favorites_collection.find(
-                {'user_id': user_id}
-            ).sort('created_at', -1).limit(limit)
+            favorites = one_batch(self.favorites_collection.find(
+                {'user_id': user_id}, {'rack_id': 1, '_id': 0}
+            ).sort('created_at', -1), limit)
             
             rack_ids = [ObjectId(fav['rack_id']) for fav in favorites]
             
             # Get the actual racks
             if rack_ids:
-                cursor = self.collection.find({'_id': {'$in': rack_ids}})
+                cursor = self.list_collection.find({'_id': {'$in': rack_ids}}, RACK_LIST_PROJECTION)
                 racks = []
                 for doc in cursor:
-                    doc['_id'] = str(doc['_id'])
                     doc['is_favorited'] = True
                     racks.append(doc)
                 return racks
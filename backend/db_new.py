@@ -5,17 +5,37 @@ This implements the PRD requirements with full MongoDB document embedding and ov
 
 import os
 import sys
-import json
 import logging
+import threading
 from datetime import datetime
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, DocumentTooLarge
+import bson
 from bson import ObjectId
-import base64
+from bson.binary import Binary
 from typing import Dict, List, Optional, Any, Tuple
+from abletonRackAnalyzer import count_devices, iter_devices, summarize_rack
+from db_utils import QUERY_MAX_TIME_MS, one_batch
 
 logger = logging.getLogger(__name__)
 
+# Connection pool sizing - one client is shared by every request handler,
+# so the pool must be large enough for the worker's concurrency
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '200'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '10'))
+# Close pooled connections idle this long, so a quiet worker drifts back to
+# minPoolSize instead of holding burst-sized pools open
+MONGO_MAX_IDLE_TIME_MS = 300000
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 5000
+# Wire compression for the text-heavy rack documents; pymongo skips zstd
+# (with a warning) if the zstandard package is missing and falls back to zlib
+MONGO_COMPRESSORS = 'zstd,zlib'
+
+# The original file is stored as BSON binary in file_content, which the JSON
+# responses can't carry; reads leave it out
+RACK_FILE_FIELDS_PROJECTION = {'file_content': 0}
+SEARCH_RESULTS_LIMIT = 100
+
 class MongoDBOptimized:
     """
     Optimized MongoDB implementation leveraging document-based design
@@ -36,9 +56,21 @@ class MongoDBOptimized:
         self.comments_overflow_collection = None
         self.ratings_overflow_collection = None
         self.connected = False
+        # Serializes connect() so concurrent first requests share one attempt
+        self._connect_lock = threading.Lock()
         
     def connect(self):
-        """Connect to MongoDB with optimized collections"""
+        """Connect to MongoDB with optimized collections, unless already connected"""
+        # Double-checked: callers racing in while another attempt runs wait
+        # for it and reuse its result instead of pinging and indexing again
+        if self.connected:
+            return True
+        with self._connect_lock:
+            if self.connected:
+                return True
+            return self._connect()
+    
+    def _connect(self):
         try:
             mongo_url = os.getenv('MONGO_URL', os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
             
@@ -46,7 +78,17 @@ class MongoDBOptimized:
                 logger.warning("No MongoDB URL found. Using local MongoDB.")
                 mongo_url = 'mongodb://localhost:27017/'
             
-            self.client = MongoClient(mongo_url)
+            # Reuse the pooled client across reconnect attempts
+            if self.client is None:
+                self.client = MongoClient(
+                    mongo_url,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    retryWrites=True,
+                    compressors=MONGO_COMPRESSORS
+                )
             self.client.admin.command('ping')
             
             # Use optimized database
@@ -78,7 +120,6 @@ class MongoDBOptimized:
             # Racks collection indexes
             self.racks_collection.create_index('filename')
             self.racks_collection.create_index('created_at')
-            self.racks_collection.create_index('user_id')
             self.racks_collection.create_index('producer_name')
             self.racks_collection.create_index([('ratings.average', -1)])
             self.racks_collection.create_index([('engagement.download_count', -1)])
@@ -176,9 +217,7 @@ class MongoDBOptimized:
                 
                 # Statistics
                 'stats': {
-                    'total_chains': len(rack_info.get('chains', [])),
-                    'total_devices': self._count_all_devices(rack_info.get('chains', [])),
-                    'macro_controls': len(rack_info.get('macro_controls', [])),
+                    **summarize_rack(rack_info),
                     'complexity_score': self._calculate_complexity_score(rack_info)
                 },
                 
@@ -197,9 +236,10 @@ class MongoDBOptimized:
                 '_overflow_refs': {}  # References to overflow collections if needed
             }
             
-            # Store file content if provided
+            # Store file content if provided, as BSON binary rather than
+            # base64 text (a third larger, and encoded/decoded on every pass)
             if file_content:
-                document['file_content'] = base64.b64encode(file_content).decode('utf-8')
+                document['file_content'] = Binary(file_content)
             
             # Calculate initial document size
             document['_doc_size'] = self._calculate_document_size(document)
@@ -228,7 +268,7 @@ class MongoDBOptimized:
                 return None
             
             # Single query gets all embedded data
-            document = self.racks_collection.find_one({'_id': ObjectId(rack_id)})
+            document = self.racks_collection.find_one({'_id': ObjectId(rack_id)}, RACK_FILE_FIELDS_PROJECTION)
             
             if not document:
                 return None
@@ -498,7 +538,7 @@ class MongoDBOptimized:
             if 'comments' in overflow_refs:
                 overflow_comments = self.comments_overflow_collection.find(
                     {'rack_id': rack_id}
-                ).sort('created_at', 1)
+                ).sort('created_at', 1).max_time_ms(QUERY_MAX_TIME_MS)
                 
                 all_comments = []
                 for overflow_doc in overflow_comments:
@@ -512,7 +552,7 @@ class MongoDBOptimized:
             if 'ratings' in overflow_refs:
                 overflow_ratings = self.ratings_overflow_collection.find(
                     {'rack_id': rack_id}
-                ).sort('created_at', 1)
+                ).sort('created_at', 1).max_time_ms(QUERY_MAX_TIME_MS)
                 
                 all_user_ratings = []
                 for overflow_doc in overflow_ratings:
@@ -540,7 +580,7 @@ class MongoDBOptimized:
                 all_ratings.extend(rack.get('ratings', {}).get('user_ratings', []))
             
             # Get overflow ratings
-            overflow_ratings = self.ratings_overflow_collection.find({'rack_id': rack_id})
+            overflow_ratings = self.ratings_overflow_collection.find({'rack_id': rack_id}).max_time_ms(QUERY_MAX_TIME_MS)
             for overflow_doc in overflow_ratings:
                 all_ratings.extend(overflow_doc.get('user_ratings', []))
             
@@ -572,9 +612,9 @@ class MongoDBOptimized:
             logger.error(f"Failed to recalculate rating with overflow: {e}")
     
     def _calculate_document_size(self, document: Dict) -> int:
-        """Calculate approximate document size in bytes"""
+        """Calculate the document's BSON size in bytes"""
         try:
-            return len(json.dumps(document, default=str).encode('utf-8'))
+            return len(bson.encode(document))
         except:
             return 0
     
@@ -619,33 +659,13 @@ class MongoDBOptimized:
         
         return metadata
     
-    def _count_all_devices(self, chains: List) -> int:
-        """Count all devices including nested ones"""
-        count = 0
-        for chain in chains:
-            for device in chain.get('devices', []):
-                count += 1
-                if 'chains' in device:
-                    count += self._count_all_devices(device['chains'])
-        return count
-    
     def _extract_device_tags(self, rack_info: Dict) -> List[str]:
         """Extract device names as tags"""
         device_tags = set()
-        
-        def extract_from_chains(chains):
-            for chain in chains:
-                for device in chain.get('devices', []):
-                    device_name = device.get('name', '').strip()
-                    if device_name and device_name != 'Unknown':
-                        tag = device_name.lower().replace(' ', '-')
-                        device_tags.add(tag)
-                    
-                    if 'chains' in device:
-                        extract_from_chains(device['chains'])
-        
-        chains = rack_info.get('chains', [])
-        extract_from_chains(chains)
+        for device, _ in iter_devices(rack_info.get('chains', [])):
+            device_name = device.get('name', '').strip()
+            if device_name and device_name != 'Unknown':
+                device_tags.add(device_name.lower().replace(' ', '-'))
         return list(device_tags)
     
     def _calculate_complexity_score(self, rack_info: Dict) -> int:
@@ -656,21 +676,10 @@ class MongoDBOptimized:
             macro_controls = rack_info.get('macro_controls', [])
             
             chain_count = len(chains)
-            device_count = self._count_all_devices(chains) + len(devices)
+            device_count = count_devices(chains) + len(devices)
             macro_count = len(macro_controls)
             
-            def max_depth(chains, current_depth=0):
-                if not chains:
-                    return current_depth
-                max_d = current_depth
-                for chain in chains:
-                    for device in chain.get('devices', []):
-                        if 'chains' in device:
-                            depth = max_depth(device['chains'], current_depth + 1)
-                            max_d = max(max_d, depth)
-                return max_d
-            
-            nesting_depth = max_depth(chains)
+            nesting_depth = max((depth + 1 for device, depth in iter_devices(chains) if 'chains' in device), default=0)
             
             complexity = min(100, (
                 device_count * 2 +
@@ -692,7 +701,7 @@ class MongoDBOptimized:
             return []
         
         try:
-            cursor = self.racks_collection.find().sort('created_at', -1).limit(limit)
+            cursor = one_batch(self.racks_collection.find({}, RACK_FILE_FIELDS_PROJECTION).sort('created_at', -1), limit)
             racks = []
             for doc in cursor:
                 doc['_id'] = str(doc['_id'])
@@ -703,14 +712,19 @@ class MongoDBOptimized:
             return []
     
     def search_racks(self, query: str) -> List[Dict]:
-        """Text search across rack content with embedded data"""
+        """Text search across rack content with embedded data, best matches first"""
         if not self.connected and not self.connect():
             return []
         
         try:
+            # Rank by text score and stop at the top matches, rather than
+            # sorting every match of a common word by date
+            score = {'$meta': 'textScore'}
             cursor = self.racks_collection.find(
-                {'$text': {'$search': query}}
-            ).sort('created_at', -1)
+                {'$text': {'$search': query}}, {**RACK_FILE_FIELDS_PROJECTION, 'score': score}
+            ).sort([('score', score)]).limit(SEARCH_RESULTS_LIMIT).batch_size(
+                SEARCH_RESULTS_LIMIT
+            ).max_time_ms(QUERY_MAX_TIME_MS)
             
             racks = []
             for doc in cursor:
@@ -721,6 +735,26 @@ class MongoDBOptimized:
             logger.error(f"Failed to search racks: {e}")
             return []
     
+    def get_popular_tags(self, limit: int = 20) -> List[Dict]:
+        """Get the most used metadata tags with their rack counts"""
+        if not self.connected and not self.connect():
+            return []
+        
+        try:
+            # $sortByCount groups and sorts in one stage; only racks with tags
+            # (served by the metadata.tags index) and only their tags reach it
+            return list(self.racks_collection.aggregate([
+                {'$match': {'metadata.tags': {'$type': 'array', '$ne': []}}},
+                {'$project': {'metadata.tags': 1}},
+                {'$unwind': '$metadata.tags'},
+                {'$sortByCount': '$metadata.tags'},
+                {'$limit': limit},
+                {'$project': {'name': '$_id', 'count': 1, '_id': 0}}
+            ], allowDiskUse=True, batchSize=limit, maxTimeMS=QUERY_MAX_TIME_MS))
+        except Exception as e:
+            logger.error(f"Failed to get popular tags: {e}")
+            return []
+    
     def increment_download_count(self, rack_id: str) -> bool:
         """Increment download count"""
         if not self.connected and not self.connect():
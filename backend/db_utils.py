@@ -0,0 +1,25 @@
+"""
+Query helpers shared by the MongoDB modules (db, db_new, db_v3_optimized)
+"""
+
+# Upper bound on list query sizes. Lists are fetched in a single batch: past
+# the server's default first batch (101 documents) a cursor would otherwise
+# need getMore round-trips to finish.
+MAX_LIST_LIMIT = 500
+# Server-side cap on interactive reads, so a runaway query fails fast instead
+# of holding a pooled connection
+QUERY_MAX_TIME_MS = 2000
+
+
+def one_batch(cursor, limit):
+    """
+    Limit a list query to at most MAX_LIST_LIMIT documents, returned in one
+    batch. A limit of 0 means no limit, as for Cursor.limit(), and leaves
+    batching to the server.
+    """
+    cursor = cursor.max_time_ms(QUERY_MAX_TIME_MS)
+    limit = int(limit)
+    if limit == 0:
+        return cursor
+    limit = min(max(limit, 1), MAX_LIST_LIMIT)
+    return cursor.limit(limit).batch_size(limit)
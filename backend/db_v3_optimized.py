@@ -6,16 +6,158 @@ This implements the PRD requirements with full MongoDB document embedding and ov
 import os
 import sys
 import json
+import io
+import re
+import hashlib
 import logging
+import threading
+from binascii import a2b_base64
 from datetime import datetime
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, DocumentTooLarge
+import pymongo
+from pymongo import IndexModel, MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, ConnectionFailure, DocumentTooLarge, OperationFailure
 from bson import ObjectId
-import base64
-from typing import Dict, List, Optional, Any, Tuple
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+import gridfs
+from typing import Dict, Iterator, List, Optional, Any, Tuple
+from abletonRackAnalyzer import ANALYZER_VERSION, count_devices, iter_devices, summarize_rack
+from db_utils import QUERY_MAX_TIME_MS
 
 logger = logging.getLogger(__name__)
 
+# Connection pool sizing - one client is shared by every request handler,
+# so the pool must be large enough for the worker's concurrency
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '200'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '10'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 2000
+MONGO_WAIT_QUEUE_TIMEOUT_MS = 2500  # Fail fast instead of queueing when the pool is exhausted
+# Close pooled connections idle this long, so a quiet worker drifts back to
+# minPoolSize instead of holding burst-sized pools open
+MONGO_MAX_IDLE_TIME_MS = 300000
+# Bound how long a request can hang on an unreachable or stalled server
+MONGO_CONNECT_TIMEOUT_MS = 2000
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '5000'))
+# Index builds and backfills run once per process inside connect(). They get
+# this budget instead of the per-request socket timeout above
+MONGO_SCHEMA_TIMEOUT_MS = int(os.getenv('MONGO_SCHEMA_TIMEOUT_MS', '600000'))
+# Wire compression for the text-heavy list/search results; pymongo skips zstd
+# (with a warning) if the zstandard package is missing and falls back to zlib
+MONGO_COMPRESSORS = 'zstd,zlib'
+
+# Rack documents carry the full nested analysis as text-heavy JSON, which
+# compresses several times better with zstd than with WiredTiger's default
+# snappy. The block compressor can only be chosen when a collection is created.
+# The original .adg files are gzip already, so their GridFS chunks keep the default.
+COMPRESSED_COLLECTIONS = ('racks', 'racks_comments_overflow', 'racks_ratings_overflow')
+ZSTD_STORAGE_ENGINE = {'wiredTiger': {'configString': 'block_compressor=zstd'}}
+NAMESPACE_EXISTS = 48
+
+# Original rack files live in GridFS; rack documents keep only the file_id.
+# Racks saved before that embed file_content (base64 text, or BSON binary when
+# written by db_new), moved on first download.
+# Single-rack reads exclude those, and rack_name_lower, which only backs
+# prefix search.
+RACK_DETAIL_PROJECTION = {'file_content': 0, 'file_id': 0, 'rack_name_lower': 0}
+
+# List and search results leave out the stored file, the full nested analysis
+# and the embedded comment/annotation/rating arrays; rack cards only need the
+# summary fields, and get_rack_with_full_data returns the rest for one rack
+LIST_PROJECTION = {
+    'file_content': 0,
+    'file_id': 0,
+    'analysis': 0,
+    'comments': 0,
+    'annotations': 0,
+    'ratings.user_ratings': 0,
+    '_overflow_refs': 0,
+    'rack_name_lower': 0
+}
+# Top-level fields a list request may ask for explicitly (?fields=)
+LIST_FIELDS = frozenset({
+    'filename', 'rack_name', 'rack_type', 'created_at', 'updated_at', 'user_id',
+    'producer_name', 'metadata', 'stats', 'engagement', 'ratings', 'files'
+})
+# Newest-first listing index; it also holds the title fields so a recent-racks
+# request for only those (?fields=rack_name,producer_name) is answered from
+# the index without fetching documents
+RECENT_COVER_INDEX = [
+    ('created_at', -1), ('_id', -1), ('rack_name', 1), ('producer_name', 1), ('filename', 1)
+]
+RECENT_RACKS_BATCH_SIZE = 50
+# Recent racks requested as raw BSON (raw=True) stay the server's bytes
+# instead of being decoded into dicts, for responses that pass them through
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+# Racks per insert_many in save_rack_analyses
+SAVE_BATCH_SIZE = 100
+# Racks updated per bulk_write when backfilling a derived field
+BACKFILL_BATCH_SIZE = 1000
+OBSOLETE_INDEXES = ('filename_1', 'producer_name_1', 'user_id_1')
+
+# Indexes per collection (besides the text index). connect() lists each
+# collection's indexes once and only creates the ones missing by name, so a
+# worker starting against an indexed database issues no index builds.
+INDEXES = {
+    'racks': [
+        IndexModel(RECENT_COVER_INDEX, name='recent_cover_idx'),
+        # Not unique: every upload still gets its own rack, only the
+        # analysis of identical files is shared
+        IndexModel('content_sha256', sparse=True),
+        # Quoted prefix search (QUOTED_PREFIX_QUERY)
+        IndexModel('rack_name_lower'),
+        IndexModel([('ratings.average', -1)]),
+        IndexModel([('engagement.download_count', -1)]),
+        IndexModel([('engagement.view_count', -1)]),
+        IndexModel('metadata.tags'),
+        IndexModel('metadata.device_tags'),
+        IndexModel('metadata.genre_tags'),
+        # Compound indexes for common queries
+        IndexModel([('user_id', 1), ('created_at', -1)]),
+        IndexModel([('metadata.difficulty', 1), ('ratings.average', -1)]),
+        IndexModel([('rack_type', 1), ('ratings.average', -1)]),
+        # Embedded array indexes for efficient queries
+        IndexModel('comments.user_id'),
+        IndexModel('comments.created_at'),
+        IndexModel('annotations.user_id'),
+        IndexModel('annotations.component_id'),
+        IndexModel('ratings.user_ratings.user_id')
+    ],
+    'users': [
+        IndexModel('username', unique=True),
+        IndexModel('email', unique=True),
+        IndexModel('favorites.rack_id'),
+        IndexModel('collections.rack_ids')
+    ],
+    'racks_comments_overflow': [
+        IndexModel('rack_id'),
+        IndexModel('created_at')
+    ],
+    'racks_ratings_overflow': [
+        IndexModel('rack_id'),
+        IndexModel('created_at')
+    ]
+}
+
+# Weighted text index backing search_racks, ranked by text score. It replaces
+# the earlier unweighted, default-named text index (a collection can only have
+# one), which is dropped on connect.
+RACK_TEXT_INDEX = 'rack_text_idx'
+RACK_TEXT_FIELDS = (
+    'rack_name', 'metadata.tags', 'producer_name', 'metadata.description',
+    'filename', 'metadata.title'
+)
+RACK_TEXT_WEIGHTS = {
+    'rack_name': 10, 'metadata.tags': 8, 'producer_name': 5,
+    'metadata.description': 3, 'filename': 2
+}
+SEARCH_RESULTS_LIMIT = 100
+# A quoted query ending in * ("Bass*") asks for rack names starting with the
+# text instead of a word search; the text index only matches whole stems.
+# It runs as an anchored, case-sensitive regex on the lowercased name, which
+# the rack_name_lower index answers with a range scan - a case-insensitive
+# regex (or a collation, which regexes ignore) would scan every key.
+QUOTED_PREFIX_QUERY = re.compile(r'^"(.+)\*"$')
+
 class MongoDBOptimized:
     """
     Optimized MongoDB implementation leveraging document-based design
@@ -36,9 +178,24 @@ class MongoDBOptimized:
         self.comments_overflow_collection = None
         self.ratings_overflow_collection = None
         self.connected = False
+        # Serializes connect() so concurrent first requests share one attempt
+        self._connect_lock = threading.Lock()
+        # Set once the indexes are in place, so reconnecting after a network
+        # blip only pays the ping
+        self._indexes_ready = False
         
     def connect(self):
-        """Connect to MongoDB with optimized collections"""
+        """Connect to MongoDB with optimized collections, unless already connected"""
+        # Double-checked: callers racing in while another attempt runs wait
+        # for it and reuse its result instead of pinging and indexing again
+        if self.connected:
+            return True
+        with self._connect_lock:
+            if self.connected:
+                return True
+            return self._connect()
+    
+    def _connect(self):
         try:
             mongo_url = os.getenv('MONGO_URL', os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
             
@@ -46,7 +203,21 @@ class MongoDBOptimized:
                 logger.warning("No MongoDB URL found. Using local MongoDB.")
                 mongo_url = 'mongodb://localhost:27017/'
             
-            self.client = MongoClient(mongo_url)
+            # Reuse the pooled client across reconnect attempts
+            if self.client is None:
+                self.client = MongoClient(
+                    mongo_url,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                    retryWrites=True,
+                    compressors=MONGO_COMPRESSORS,
+                    connect=False
+                )
             self.client.admin.command('ping')
             
             # Use optimized database
@@ -55,9 +226,13 @@ class MongoDBOptimized:
             self.users_collection = self.db.users
             self.comments_overflow_collection = self.db.racks_comments_overflow
             self.ratings_overflow_collection = self.db.racks_ratings_overflow
+            self.fs = gridfs.GridFS(self.db, collection='rack_files')
             
-            # Create optimized indexes
-            self._create_indexes()
+            # Create compressed collections and optimized indexes
+            if not self._indexes_ready:
+                with pymongo.timeout(MONGO_SCHEMA_TIMEOUT_MS / 1000):
+                    self._create_compressed_collections()
+                    self._indexes_ready = self._create_indexes()
             
             self.connected = True
             logger.info("Successfully connected to MongoDB (Optimized Schema v3)")
@@ -72,143 +247,173 @@ class MongoDBOptimized:
             self.connected = False
             return False
     
-    def _create_indexes(self):
-        """Create optimized indexes for embedded document queries"""
+    def _create_compressed_collections(self):
+        """Create missing rack collections with zstd block compression"""
+        existing = set(self.db.list_collection_names())
+        for name in COMPRESSED_COLLECTIONS:
+            if name in existing:
+                continue
+            try:
+                self.db.create_collection(name, storageEngine=ZSTD_STORAGE_ENGINE)
+            except CollectionInvalid:
+                # Created since list_collection_names(), e.g. by another worker
+                pass
+            except OperationFailure as e:
+                # Code 48 is the same race reported by the server. Otherwise
+                # the collection is created implicitly (with the server default
+                # compressor) on first insert, so this is not fatal
+                if e.code != NAMESPACE_EXISTS:
+                    logger.warning(f"Could not create zstd-compressed collection {name}: {e}")
+    
+    def _create_indexes(self) -> bool:
+        """Create optimized indexes for embedded document queries, returning whether they all were"""
         try:
-            # Racks collection indexes
-            self.racks_collection.create_index('filename')
-            self.racks_collection.create_index('created_at')
-            self.racks_collection.create_index('user_id')
-            self.racks_collection.create_index('producer_name')
-            self.racks_collection.create_index([('ratings.average', -1)])
-            self.racks_collection.create_index([('engagement.download_count', -1)])
-            self.racks_collection.create_index([('engagement.view_count', -1)])
-            self.racks_collection.create_index('metadata.tags')
-            self.racks_collection.create_index('metadata.device_tags')
-            self.racks_collection.create_index('metadata.genre_tags')
-            
-            # Compound indexes for common queries
-            self.racks_collection.create_index([('user_id', 1), ('created_at', -1)])
-            self.racks_collection.create_index([('metadata.difficulty', 1), ('ratings.average', -1)])
-            self.racks_collection.create_index([('rack_type', 1), ('ratings.average', -1)])
+            # Racks collection indexes. Nothing filters on filename or
+            # producer_name alone, so their old single-field indexes only
+            # cost writes and are dropped. user_id lookups are served by the
+            # (user_id, created_at) index.
+            existing = self.racks_collection.index_information()
+            for name in OBSOLETE_INDEXES:
+                if name in existing:
+                    self.racks_collection.drop_index(name)
+            
+            for collection_name, indexes in INDEXES.items():
+                collection = self.db[collection_name]
+                present = existing if collection is self.racks_collection else collection.index_information()
+                missing = [index for index in indexes if index.document['name'] not in present]
+                if missing:
+                    collection.create_indexes(missing)
             
             # Text search index
-            self.racks_collection.create_index([
-                ('rack_name', 'text'),
-                ('metadata.title', 'text'),
-                ('metadata.description', 'text'),
-                ('metadata.tags', 'text'),
-                ('producer_name', 'text')
-            ])
+            self._ensure_text_index(existing)
             
-            # Embedded array indexes for efficient queries
-            self.racks_collection.create_index('comments.user_id')
-            self.racks_collection.create_index('comments.created_at')
-            self.racks_collection.create_index('annotations.user_id')
-            self.racks_collection.create_index('annotations.component_id')
-            self.racks_collection.create_index('ratings.user_ratings.user_id')
+            self._backfill_rack_name_lower()
             
-            # Users collection indexes
-            self.users_collection.create_index('username', unique=True)
-            self.users_collection.create_index('email', unique=True)
-            self.users_collection.create_index('favorites.rack_id')
-            self.users_collection.create_index('collections.rack_ids')
-            
-            # Overflow collection indexes
-            self.comments_overflow_collection.create_index('rack_id')
-            self.comments_overflow_collection.create_index('created_at')
-            self.ratings_overflow_collection.create_index('rack_id')
-            self.ratings_overflow_collection.create_index('created_at')
-            
-            logger.info("Created optimized database indexes")
+            logger.info("Ensured optimized database indexes")
+            return True
             
         except Exception as e:
             logger.error(f"Failed to create indexes: {e}")
+            return False
     
     def save_rack_analysis(self, rack_info: Dict, filename: str, 
                           file_content: bytes = None, user_id: str = None, 
                           enhanced_metadata: Dict = None) -> Optional[str]:
-        """Save rack with optimized embedded document structure"""
+        """Save rack with optimized embedded document structure, returning its ID"""
+        document = self.save_rack_document(rack_info, filename, file_content, user_id, enhanced_metadata)
+        return document['_id'] if document else None
+    
+    def _build_rack_document(self, rack_info: Dict, filename: str, 
+                             file_content: bytes = None, user_id: str = None, 
+                             enhanced_metadata: Dict = None,
+                             content_sha256: str = None) -> Dict:
+        """Build a new rack document, storing the original file in GridFS"""
+        # Build the optimized rack document
+        document = {
+            # Basic rack information
+            'filename': filename,
+            'rack_name': rack_info.get('rack_name', 'Unknown'),
+            'rack_name_lower': rack_info.get('rack_name', 'Unknown').lower(),
+            'rack_type': rack_info.get('rack_type', 'Unknown'),
+            'created_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow(),
+            
+            # User/Producer information
+            'user_id': user_id,
+            'producer_name': enhanced_metadata.get('producer_name', '') if enhanced_metadata else '',
+            
+            # Core analysis data
+            'analysis': rack_info,
+            
+            # Enhanced metadata
+            'metadata': self._build_metadata(rack_info, enhanced_metadata),
+            
+            # EMBEDDED: Comments array (starts empty)
+            'comments': [],
+            
+            # EMBEDDED: Ratings with embedded user_ratings
+            'ratings': {
+                'average': 0.0,
+                'count': 0,
+                'distribution': {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0},
+                'user_ratings': []  # Embedded recent ratings
+            },
+            
+            # EMBEDDED: Annotations array (starts empty)
+            'annotations': [],
+            
+            # Engagement metrics
+            'engagement': {
+                'view_count': 0,
+                'download_count': 0,
+                'favorite_count': 0,
+                'fork_count': 0
+            },
+            
+            # Statistics
+            # Recomputed here rather than trusting a client-supplied rack_info['stats']
+            'stats': {
+                **summarize_rack(rack_info),
+                'complexity_score': self._calculate_complexity_score(rack_info)
+            },
+            
+            # File references
+            'files': {
+                'original_file': {
+                    'size': len(file_content) if file_content else 0,
+                    'checksum': None
+                },
+                'preview_audio': None,
+                'thumbnail': None
+            },
+            
+            # Document size monitoring
+            '_doc_size': 0,  # Will be calculated after insert
+            '_overflow_refs': {}  # References to overflow collections if needed
+        }
+        
+        # Store the original file in GridFS, referenced by file_id, so the
+        # rack document stays small. The content hash lets a re-upload of
+        # the same file reuse this analysis (find_analysis_by_content) while
+        # the analyzer that produced it is still current.
+        if file_content:
+            document['content_sha256'] = content_sha256 or hashlib.sha256(file_content).hexdigest()
+            document['analyzer_version'] = ANALYZER_VERSION
+            document['file_id'] = self.fs.put(file_content, filename=filename)
+        
+        # Calculate initial document size
+        document['_doc_size'] = self._calculate_document_size(document)
+        return document
+    
+    def save_rack_document(self, rack_info: Dict, filename: str, 
+                           file_content: bytes = None, user_id: str = None, 
+                           enhanced_metadata: Dict = None,
+                           content_sha256: str = None) -> Optional[Dict]:
+        """
+        Save rack with optimized embedded document structure, returning the
+        saved document (as get_rack_with_full_data would, without file fields)
+        so callers don't need to read it back
+        """
         if not self.connected and not self.connect():
             return None
         
         try:
-            # Build the optimized rack document
-            document = {
-                # Basic rack information
-                'filename': filename,
-                'rack_name': rack_info.get('rack_name', 'Unknown'),
-                'rack_type': rack_info.get('rack_type', 'Unknown'),
-                'created_at': datetime.utcnow(),
-                'updated_at': datetime.utcnow(),
-                
-                # User/Producer information
-                'user_id': user_id,
-                'producer_name': enhanced_metadata.get('producer_name', '') if enhanced_metadata else '',
-                
-                # Core analysis data
-                'analysis': rack_info,
-                
-                # Enhanced metadata
-                'metadata': self._build_metadata(rack_info, enhanced_metadata),
-                
-                # EMBEDDED: Comments array (starts empty)
-                'comments': [],
-                
-                # EMBEDDED: Ratings with embedded user_ratings
-                'ratings': {
-                    'average': 0.0,
-                    'count': 0,
-                    'distribution': {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0},
-                    'user_ratings': []  # Embedded recent ratings
-                },
-                
-                # EMBEDDED: Annotations array (starts empty)
-                'annotations': [],
-                
-                # Engagement metrics
-                'engagement': {
-                    'view_count': 0,
-                    'download_count': 0,
-                    'favorite_count': 0,
-                    'fork_count': 0
-                },
-                
-                # Statistics
-                'stats': {
-                    'total_chains': len(rack_info.get('chains', [])),
-                    'total_devices': self._count_all_devices(rack_info.get('chains', [])),
-                    'macro_controls': len(rack_info.get('macro_controls', [])),
-                    'complexity_score': self._calculate_complexity_score(rack_info)
-                },
-                
-                # File references
-                'files': {
-                    'original_file': {
-                        'size': len(file_content) if file_content else 0,
-                        'checksum': None
-                    },
-                    'preview_audio': None,
-                    'thumbnail': None
-                },
-                
-                # Document size monitoring
-                '_doc_size': 0,  # Will be calculated after insert
-                '_overflow_refs': {}  # References to overflow collections if needed
-            }
-            
-            # Store file content if provided
-            if file_content:
-                document['file_content'] = base64.b64encode(file_content).decode('utf-8')
-            
-            # Calculate initial document size
-            document['_doc_size'] = self._calculate_document_size(document)
+            document = self._build_rack_document(
+                rack_info, filename, file_content, user_id, enhanced_metadata, content_sha256
+            )
             
             # Insert into MongoDB
-            result = self.racks_collection.insert_one(document)
+            try:
+                result = self.racks_collection.insert_one(document)
+            except Exception:
+                if 'file_id' in document:
+                    self.fs.delete(document['file_id'])
+                raise
             logger.info(f"Saved optimized rack analysis with ID: {result.inserted_id}")
             
-            return str(result.inserted_id)
+            document['_id'] = str(result.inserted_id)
+            document.pop('file_id', None)
+            return document
             
         except DocumentTooLarge:
             logger.error("Document too large even without embedded data")
@@ -217,6 +422,69 @@ class MongoDBOptimized:
             logger.error(f"Failed to save rack analysis: {e}")
             return None
     
+    def save_rack_analyses(self, racks: List[Dict]) -> List[Optional[str]]:
+        """
+        Save many racks (each a dict of save_rack_analysis arguments) with one
+        unordered insert_many per SAVE_BATCH_SIZE racks, for bulk imports.
+        Returns the new IDs in input order, None for racks that failed.
+        """
+        if not self.connected and not self.connect():
+            return [None] * len(racks)
+        
+        ids = []
+        for start in range(0, len(racks), SAVE_BATCH_SIZE):
+            documents = []
+            for rack in racks[start:start + SAVE_BATCH_SIZE]:
+                try:
+                    documents.append(self._build_rack_document(**rack))
+                except Exception as e:
+                    logger.error(f"Failed to build rack document for {rack.get('filename')}: {e}")
+                    documents.append(None)
+            
+            to_insert = [document for document in documents if document is not None]
+            failed = set()
+            delete_files = True
+            try:
+                if to_insert:
+                    self.racks_collection.insert_many(to_insert, ordered=False)
+            except BulkWriteError as e:
+                failed = {error['index'] for error in e.details.get('writeErrors', [])}
+                logger.error(f"Failed to save {len(failed)} of {len(to_insert)} racks")
+            except Exception as e:
+                # A timeout or lost reply can follow a partial insert, so ask
+                # which documents made it before treating the rest as failed
+                logger.error(f"Failed to save rack batch: {e}")
+                failed = self._missing_documents(to_insert)
+                if failed is None:
+                    # Outcome unknown: report the batch as failed, but keep its
+                    # files rather than leave saved racks pointing at deleted ones
+                    failed = set(range(len(to_insert)))
+                    delete_files = False
+            
+            # insert_many sets _id on every document it was given, inserted or not
+            for index, document in enumerate(to_insert):
+                if index in failed and delete_files and 'file_id' in document:
+                    self.fs.delete(document['file_id'])
+            failed_ids = {id(to_insert[index]) for index in failed}
+            ids.extend(
+                str(document['_id']) if document is not None and id(document) not in failed_ids else None
+                for document in documents
+            )
+        
+        logger.info(f"Saved {sum(rack_id is not None for rack_id in ids)} of {len(racks)} racks")
+        return ids
+    
+    def _missing_documents(self, documents: List[Dict]) -> Optional[set]:
+        """Indexes of the documents not in the racks collection, or None if that can't be checked"""
+        try:
+            present = {doc['_id'] for doc in self.racks_collection.find(
+                {'_id': {'$in': [document['_id'] for document in documents if '_id' in document]}}, {'_id': 1}
+            )}
+        except Exception as e:
+            logger.error(f"Failed to check which racks were saved: {e}")
+            return None
+        return {index for index, document in enumerate(documents) if document.get('_id') not in present}
+    
     def get_rack_with_full_data(self, rack_id: str) -> Optional[Dict]:
         """Get complete rack data including embedded and overflow data in optimized way"""
         if not self.connected and not self.connect():
@@ -227,8 +495,13 @@ class MongoDBOptimized:
                 logger.error(f"Invalid ObjectId format: {rack_id}")
                 return None
             
-            # Single query gets all embedded data
-            document = self.racks_collection.find_one({'_id': ObjectId(rack_id)})
+            # Single round-trip: fetch all embedded data and increment the
+            # view count atomically (returns the document as it was before the $inc)
+            document = self.racks_collection.find_one_and_update(
+                {'_id': ObjectId(rack_id)},
+                {'$inc': {'engagement.view_count': 1}},
+                projection=RACK_DETAIL_PROJECTION
+            )
             
             if not document:
                 return None
@@ -240,18 +513,83 @@ class MongoDBOptimized:
             if document.get('_overflow_refs'):
                 document = self._merge_overflow_data(document, rack_id)
             
-            # Increment view count atomically
-            self.racks_collection.update_one(
+            return document
+            
+        except Exception as e:
+            logger.error(f"Failed to get rack: {e}")
+            return None
+    
+    def find_analysis_by_content(self, content_sha256: str) -> Optional[Dict]:
+        """Analysis of an earlier upload of the same file (by SHA-256) by the current analyzer, or None"""
+        if not self.connected and not self.connect():
+            return None
+        
+        try:
+            document = self.racks_collection.find_one(
+                {'content_sha256': content_sha256, 'analyzer_version': ANALYZER_VERSION},
+                {'analysis': 1}
+            )
+            return document.get('analysis') if document else None
+        except Exception as e:
+            logger.error(f"Failed to look up rack by content hash: {e}")
+            return None
+    
+    def get_rack_file(self, rack_id: str) -> Optional[Dict]:
+        """
+        Get the original file of a rack for download.
+        Returns a dict with filename, created_at and a readable 'file' object
+        (None if the rack has no stored file), or None if the rack doesn't exist.
+        """
+        if not self.connected and not self.connect():
+            return None
+        
+        try:
+            document = self.racks_collection.find_one(
                 {'_id': ObjectId(rack_id)},
-                {'$inc': {'engagement.view_count': 1}}
+                {'filename': 1, 'created_at': 1, 'file_id': 1, 'file_content': 1}
             )
+            if not document:
+                return None
             
-            return document
+            if document.get('file_id'):
+                # GridOut streams the file chunk by chunk
+                rack_file = self.fs.get(document['file_id'])
+            elif document.get('file_content'):
+                # Racks saved before GridFS embed the bytes (raw or base64 text);
+                # move them into GridFS so the next download streams too
+                file_content = document['file_content']
+                if isinstance(file_content, str):
+                    file_content = a2b_base64(file_content)
+                self._move_file_to_gridfs(document, file_content)
+                rack_file = io.BytesIO(file_content)
+            else:
+                rack_file = None
             
+            return {
+                '_id': str(document['_id']),
+                'filename': document.get('filename', 'rack.adg'),
+                'created_at': document.get('created_at'),
+                'file': rack_file
+            }
         except Exception as e:
-            logger.error(f"Failed to get rack: {e}")
+            logger.error(f"Failed to get rack file: {e}")
             return None
     
+    def _move_file_to_gridfs(self, document: Dict, file_content: bytes):
+        """Move a rack's embedded file_content into GridFS, leaving a file_id behind"""
+        file_id = self.fs.put(file_content, filename=document.get('filename', 'rack.adg'))
+        try:
+            # Only the first concurrent download of a legacy rack gets to migrate it
+            result = self.racks_collection.update_one(
+                {'_id': document['_id'], 'file_id': {'$exists': False}},
+                {'$set': {'file_id': file_id}, '$unset': {'file_content': ''}}
+            )
+            if result.modified_count == 0:
+                self.fs.delete(file_id)
+        except Exception as e:
+            self.fs.delete(file_id)
+            logger.warning(f"Failed to move rack file to GridFS: {e}")
+    
     def add_comment(self, rack_id: str, user_id: str, content: str, 
                    username: str, parent_comment_id: str = None) -> bool:
         """Add comment with overflow management"""
@@ -270,17 +608,6 @@ class MongoDBOptimized:
                 'replies': [] if not parent_comment_id else None
             }
             
-            # Check if we need overflow management
-            rack = self.racks_collection.find_one({'_id': ObjectId(rack_id)})
-            if not rack:
-                return False
-            
-            current_comments = len(rack.get('comments', []))
-            
-            if current_comments >= self.MAX_COMMENTS_EMBEDDED:
-                # Move oldest comments to overflow before adding new one
-                self._manage_comments_overflow(rack_id, rack.get('comments', []))
-            
             # Add new comment
             if parent_comment_id:
                 # Add as reply
@@ -294,21 +621,30 @@ class MongoDBOptimized:
                         '$set': {'updated_at': datetime.utcnow()}
                     }
                 )
+                if result.modified_count == 0:
+                    return False
             else:
-                # Add as top-level comment
-                result = self.racks_collection.update_one(
+                # Add as top-level comment; the push returns just the comment
+                # IDs so the overflow check needs no separate read
+                rack = self.racks_collection.find_one_and_update(
                     {'_id': ObjectId(rack_id)},
                     {
                         '$push': {'comments': comment},
                         '$set': {'updated_at': datetime.utcnow()}
-                    }
+                    },
+                    projection={'comments.id': 1},
+                    return_document=ReturnDocument.AFTER
                 )
+                if not rack:
+                    return False
+                
+                if len(rack.get('comments', [])) > self.MAX_COMMENTS_EMBEDDED:
+                    # Move oldest comments to overflow
+                    self._manage_comments_overflow(rack_id)
             
             # Update document size tracking
-            if result.modified_count > 0:
-                self._update_document_size(rack_id)
-            
-            return result.modified_count > 0
+            self._update_document_size(rack_id)
+            return True
             
         except Exception as e:
             logger.error(f"Failed to add comment: {e}")
@@ -324,24 +660,6 @@ class MongoDBOptimized:
             if not 1 <= rating <= 5:
                 return False
             
-            # Remove existing rating from this user first
-            self.racks_collection.update_one(
-                {'_id': ObjectId(rack_id)},
-                {'$pull': {'ratings.user_ratings': {'user_id': user_id}}}
-            )
-            
-            # Check if we need overflow management
-            rack = self.racks_collection.find_one({'_id': ObjectId(rack_id)})
-            if not rack:
-                return False
-            
-            current_ratings = len(rack.get('ratings', {}).get('user_ratings', []))
-            
-            if current_ratings >= self.MAX_RATINGS_EMBEDDED:
-                # Move oldest ratings to overflow
-                self._manage_ratings_overflow(rack_id, rack.get('ratings', {}).get('user_ratings', []))
-            
-            # Add new rating
             rating_obj = {
                 'user_id': user_id,
                 'username': username,
@@ -350,21 +668,30 @@ class MongoDBOptimized:
                 'created_at': datetime.utcnow()
             }
             
-            result = self.racks_collection.update_one(
-                {'_id': ObjectId(rack_id)},
-                {
-                    '$push': {'ratings.user_ratings': rating_obj},
-                    '$set': {'updated_at': datetime.utcnow()}
-                }
-            )
+            # Replace this user's existing rating: the pull and push can't
+            # share one update, but go to the server in a single ordered batch
+            result = self.racks_collection.bulk_write([
+                UpdateOne(
+                    {'_id': ObjectId(rack_id)},
+                    {'$pull': {'ratings.user_ratings': {'user_id': user_id}}}
+                ),
+                UpdateOne(
+                    {'_id': ObjectId(rack_id)},
+                    {
+                        '$push': {'ratings.user_ratings': rating_obj},
+                        '$set': {'updated_at': datetime.utcnow()}
+                    }
+                )
+            ])
             
-            if result.modified_count > 0:
-                # Recalculate average rating including overflow data
-                self._recalculate_rating_with_overflow(rack_id)
-                self._update_document_size(rack_id)
-                return True
+            if result.matched_count == 0:
+                return False
             
-            return False
+            # Recalculate average rating including overflow data, moving the
+            # oldest ratings to overflow first if there are too many embedded
+            self._recalculate_rating_with_overflow(rack_id)
+            self._update_document_size(rack_id)
+            return True
             
         except Exception as e:
             logger.error(f"Failed to rate rack: {e}")
@@ -386,26 +713,16 @@ class MongoDBOptimized:
                 'created_at': datetime.utcnow()
             }
             
-            # Check annotation count for overflow
-            rack = self.racks_collection.find_one({'_id': ObjectId(rack_id)})
-            if not rack:
-                return False
-            
-            current_annotations = len(rack.get('annotations', []))
-            
-            if current_annotations >= self.MAX_ANNOTATIONS_EMBEDDED:
-                # For annotations, we might want to remove oldest instead of overflow
-                # since they're position-dependent and overflow might not make sense
-                self.racks_collection.update_one(
-                    {'_id': ObjectId(rack_id)},
-                    {'$pop': {'annotations': -1}}  # Remove oldest
-                )
-            
-            # Add new annotation
+            # Add new annotation. Annotations don't overflow since they're
+            # position-dependent; $slice drops the oldest beyond the limit in
+            # the same update.
             result = self.racks_collection.update_one(
                 {'_id': ObjectId(rack_id)},
                 {
-                    '$push': {'annotations': annotation},
+                    '$push': {'annotations': {
+                        '$each': [annotation],
+                        '$slice': -self.MAX_ANNOTATIONS_EMBEDDED
+                    }},
                     '$set': {'updated_at': datetime.utcnow()}
                 }
             )
@@ -419,14 +736,15 @@ class MongoDBOptimized:
             logger.error(f"Failed to add annotation: {e}")
             return False
     
-    def _manage_comments_overflow(self, rack_id: str, comments: List[Dict]):
+    def _manage_comments_overflow(self, rack_id: str):
         """Move oldest comments to overflow collection"""
         try:
+            rack = self.racks_collection.find_one({'_id': ObjectId(rack_id)}, {'comments': 1})
+            comments = rack.get('comments', []) if rack else []
             if len(comments) <= self.MAX_COMMENTS_EMBEDDED:
                 return
             
             # Keep newest comments, move oldest to overflow
-            comments_to_keep = comments[-(self.MAX_COMMENTS_EMBEDDED//2):]
             comments_to_overflow = comments[:-(self.MAX_COMMENTS_EMBEDDED//2)]
             
             # Save to overflow collection
@@ -438,14 +756,13 @@ class MongoDBOptimized:
             
             overflow_result = self.comments_overflow_collection.insert_one(overflow_doc)
             
-            # Update main document
+            # Pull the moved comments by ID rather than overwriting the array,
+            # so comments added meanwhile aren't lost
             self.racks_collection.update_one(
                 {'_id': ObjectId(rack_id)},
                 {
-                    '$set': {
-                        'comments': comments_to_keep,
-                        '_overflow_refs.comments': overflow_result.inserted_id
-                    }
+                    '$pull': {'comments': {'id': {'$in': [c['id'] for c in comments_to_overflow]}}},
+                    '$set': {'_overflow_refs.comments': overflow_result.inserted_id}
                 }
             )
             
@@ -454,14 +771,13 @@ class MongoDBOptimized:
         except Exception as e:
             logger.error(f"Failed to manage comments overflow: {e}")
     
-    def _manage_ratings_overflow(self, rack_id: str, ratings: List[Dict]):
-        """Move oldest ratings to overflow collection"""
+    def _manage_ratings_overflow(self, rack_id: str, ratings: List[Dict]) -> bool:
+        """Move oldest ratings to overflow collection, returning whether any were moved"""
         try:
             if len(ratings) <= self.MAX_RATINGS_EMBEDDED:
-                return
+                return False
             
             # Keep newest ratings, move oldest to overflow
-            ratings_to_keep = ratings[-(self.MAX_RATINGS_EMBEDDED//2):]
             ratings_to_overflow = ratings[:-(self.MAX_RATINGS_EMBEDDED//2)]
             
             # Save to overflow collection
@@ -473,21 +789,22 @@ class MongoDBOptimized:
             
             overflow_result = self.ratings_overflow_collection.insert_one(overflow_doc)
             
-            # Update main document
+            # Pull the moved ratings rather than overwriting the array, so
+            # ratings added meanwhile aren't lost
             self.racks_collection.update_one(
                 {'_id': ObjectId(rack_id)},
                 {
-                    '$set': {
-                        'ratings.user_ratings': ratings_to_keep,
-                        '_overflow_refs.ratings': overflow_result.inserted_id
-                    }
+                    '$pull': {'ratings.user_ratings': {'user_id': {'$in': [r['user_id'] for r in ratings_to_overflow]}}},
+                    '$set': {'_overflow_refs.ratings': overflow_result.inserted_id}
                 }
             )
             
             logger.info(f"Moved {len(ratings_to_overflow)} ratings to overflow for rack {rack_id}")
+            return True
             
         except Exception as e:
             logger.error(f"Failed to manage ratings overflow: {e}")
+            return False
     
     def _merge_overflow_data(self, document: Dict, rack_id: str) -> Dict:
         """Merge overflow data with main document for complete view"""
@@ -498,7 +815,7 @@ class MongoDBOptimized:
             if 'comments' in overflow_refs:
                 overflow_comments = self.comments_overflow_collection.find(
                     {'rack_id': rack_id}
-                ).sort('created_at', 1)
+                ).sort('created_at', 1).max_time_ms(QUERY_MAX_TIME_MS)
                 
                 all_comments = []
                 for overflow_doc in overflow_comments:
@@ -512,7 +829,7 @@ class MongoDBOptimized:
             if 'ratings' in overflow_refs:
                 overflow_ratings = self.ratings_overflow_collection.find(
                     {'rack_id': rack_id}
-                ).sort('created_at', 1)
+                ).sort('created_at', 1).max_time_ms(QUERY_MAX_TIME_MS)
                 
                 all_user_ratings = []
                 for overflow_doc in overflow_ratings:
@@ -535,14 +852,26 @@ class MongoDBOptimized:
             all_ratings = []
             
             # Get embedded ratings
-            rack = self.racks_collection.find_one({'_id': ObjectId(rack_id)})
-            if rack:
-                all_ratings.extend(rack.get('ratings', {}).get('user_ratings', []))
-            
-            # Get overflow ratings
-            overflow_ratings = self.ratings_overflow_collection.find({'rack_id': rack_id})
-            for overflow_doc in overflow_ratings:
-                all_ratings.extend(overflow_doc.get('user_ratings', []))
+            rack = self.racks_collection.find_one(
+                {'_id': ObjectId(rack_id)},
+                {'ratings.user_ratings': 1, '_overflow_refs.ratings': 1}
+            )
+            if not rack:
+                return
+            embedded_ratings = rack.get('ratings', {}).get('user_ratings', [])
+            
+            if (len(embedded_ratings) > self.MAX_RATINGS_EMBEDDED
+                    and self._manage_ratings_overflow(rack_id, embedded_ratings)):
+                # The moved ratings are read back from overflow below
+                embedded_ratings = embedded_ratings[-(self.MAX_RATINGS_EMBEDDED//2):]
+                rack['_overflow_refs'] = {'ratings': True}
+            all_ratings.extend(embedded_ratings)
+            
+            # Get overflow ratings (only racks that have overflowed any)
+            if rack.get('_overflow_refs', {}).get('ratings'):
+                overflow_ratings = self.ratings_overflow_collection.find({'rack_id': rack_id}).max_time_ms(QUERY_MAX_TIME_MS)
+                for overflow_doc in overflow_ratings:
+                    all_ratings.extend(overflow_doc.get('user_ratings', []))
             
             if not all_ratings:
                 return
@@ -581,13 +910,16 @@ class MongoDBOptimized:
     def _update_document_size(self, rack_id: str):
         """Update document size tracking"""
         try:
-            rack = self.racks_collection.find_one({'_id': ObjectId(rack_id)})
+            # The server measures the document itself ($bsonSize), so the
+            # whole rack isn't read back just to be sized
+            rack = self.racks_collection.find_one_and_update(
+                {'_id': ObjectId(rack_id)},
+                [{'$set': {'_doc_size': {'$bsonSize': '$$ROOT'}}}],
+                projection={'_doc_size': 1},
+                return_document=ReturnDocument.AFTER
+            )
             if rack:
-                doc_size = self._calculate_document_size(rack)
-                self.racks_collection.update_one(
-                    {'_id': ObjectId(rack_id)},
-                    {'$set': {'_doc_size': doc_size}}
-                )
+                doc_size = rack['_doc_size']
                 
                 # Warning if approaching limit
                 if doc_size > self.MAX_DOCUMENT_SIZE * 0.9:
@@ -619,33 +951,13 @@ class MongoDBOptimized:
         
         return metadata
     
-    def _count_all_devices(self, chains: List) -> int:
-        """Count all devices including nested ones"""
-        count = 0
-        for chain in chains:
-            for device in chain.get('devices', []):
-                count += 1
-                if 'chains' in device:
-                    count += self._count_all_devices(device['chains'])
-        return count
-    
     def _extract_device_tags(self, rack_info: Dict) -> List[str]:
         """Extract device names as tags"""
         device_tags = set()
-        
-        def extract_from_chains(chains):
-            for chain in chains:
-                for device in chain.get('devices', []):
-                    device_name = device.get('name', '').strip()
-                    if device_name and device_name != 'Unknown':
-                        tag = device_name.lower().replace(' ', '-')
-                        device_tags.add(tag)
-                    
-                    if 'chains' in device:
-                        extract_from_chains(device['chains'])
-        
-        chains = rack_info.get('chains', [])
-        extract_from_chains(chains)
+        for device, _ in iter_devices(rack_info.get('chains', [])):
+            device_name = device.get('name', '').strip()
+            if device_name and device_name != 'Unknown':
+                device_tags.add(device_name.lower().replace(' ', '-'))
         return list(device_tags)
     
     def _calculate_complexity_score(self, rack_info: Dict) -> int:
@@ -656,21 +968,10 @@ class MongoDBOptimized:
             macro_controls = rack_info.get('macro_controls', [])
             
             chain_count = len(chains)
-            device_count = self._count_all_devices(chains) + len(devices)
+            device_count = count_devices(chains) + len(devices)
             macro_count = len(macro_controls)
             
-            def max_depth(chains, current_depth=0):
-                if not chains:
-                    return current_depth
-                max_d = current_depth
-                for chain in chains:
-                    for device in chain.get('devices', []):
-                        if 'chains' in device:
-                            depth = max_depth(device['chains'], current_depth + 1)
-                            max_d = max(max_d, depth)
-                return max_d
-            
-            nesting_depth = max_depth(chains)
+            nesting_depth = max((depth + 1 for device, depth in iter_devices(chains) if 'chains' in device), default=0)
             
             complexity = min(100, (
                 device_count * 2 +
@@ -686,41 +987,131 @@ class MongoDBOptimized:
             return 0
 
     # Additional methods for complete API compatibility
-    def get_recent_racks(self, limit: int = 10) -> List[Dict]:
-        """Get recent racks with optimized embedded data"""
+    def get_recent_racks(self, limit: int = 10, fields: Optional[List[str]] = None,
+                         raw: bool = False) -> List[Dict]:
+        """Get recent racks' summary fields, or only the given LIST_FIELDS (as RawBSONDocuments if raw)"""
         if not self.connected and not self.connect():
             return []
         
         try:
-            cursor = self.racks_collection.find().sort('created_at', -1).limit(limit)
-            racks = []
-            for doc in cursor:
-                doc['_id'] = str(doc['_id'])
-                racks.append(doc)
-            return racks
+            return list(self.iter_recent_racks(limit, fields, raw))
         except Exception as e:
             logger.error(f"Failed to get recent racks: {e}")
             return []
     
+    def iter_recent_racks(self, limit: int = 10, fields: Optional[List[str]] = None,
+                          raw: bool = False) -> Iterator[Dict]:
+        """Yield recent racks one at a time as the cursor returns them (see get_recent_racks)"""
+        if not self.connected and not self.connect():
+            return
+        
+        collection = self.racks_collection
+        if raw:
+            collection = collection.with_options(codec_options=RAW_CODEC_OPTIONS)
+        projection = self._list_projection(fields)
+        # Sorting on the index's leading keys keeps this an index scan
+        # (covered when only RECENT_COVER_INDEX fields are requested).
+        # ObjectIds are left for the app's JSON provider to serialize.
+        yield from collection.find({}, projection).sort(
+            RECENT_COVER_INDEX[:2]
+        ).limit(limit).batch_size(RECENT_RACKS_BATCH_SIZE).max_time_ms(QUERY_MAX_TIME_MS)
+    
+    def get_recent_racks_with_count(self, limit: int = 10, skip: int = 0,
+                                    fields: Optional[List[str]] = None) -> Optional[Tuple[List[Dict], int]]:
+        """Get a page of recent racks and the total rack count, or None if the page can't be read"""
+        if not self.connected and not self.connect():
+            return None
+        
+        try:
+            # The page is read with the same index scan as get_recent_racks.
+            # A $facet over the sorted collection can't use the index and would
+            # stream every full rack document through the pipeline to count it.
+            racks = list(self.racks_collection.find({}, self._list_projection(fields)).sort(
+                RECENT_COVER_INDEX[:2]
+            ).skip(skip).limit(limit).max_time_ms(QUERY_MAX_TIME_MS))
+            # The listing is unfiltered, so the collection metadata count is
+            # the total and no documents are scanned for it
+            total = self.racks_collection.estimated_document_count(maxTimeMS=QUERY_MAX_TIME_MS)
+            return racks, total
+        except Exception as e:
+            logger.error(f"Failed to get recent racks page: {e}")
+            return None
+    
+    def _list_projection(self, fields: Optional[List[str]]) -> Dict:
+        """Inclusion projection for the requested LIST_FIELDS, or LIST_PROJECTION when none are valid"""
+        requested = [field for field in fields or () if field in LIST_FIELDS]
+        if not requested:
+            return LIST_PROJECTION
+        return {field: 1 for field in requested}
+    
+    def _ensure_text_index(self, existing: Dict):
+        """Create the weighted rack text index, dropping any other text index"""
+        weights = {field: RACK_TEXT_WEIGHTS.get(field, 1) for field in RACK_TEXT_FIELDS}
+        current = False
+        for name, info in existing.items():
+            if not any(key == '_fts' for key, _ in info['key']):
+                continue
+            if name == RACK_TEXT_INDEX and dict(info.get('weights', {})) == weights:
+                current = True
+            else:
+                self.racks_collection.drop_index(name)
+        if current:
+            return
+        
+        self.racks_collection.create_index(
+            [(field, 'text') for field in RACK_TEXT_FIELDS],
+            weights=weights,
+            name=RACK_TEXT_INDEX
+        )
+    
+    def _backfill_rack_name_lower(self) -> None:
+        """Set rack_name_lower on racks saved before it existed"""
+        # Lowercased in Python as on save: $toLower only folds ASCII, so a
+        # server-side backfill would miss prefix searches on names like "Überbass"
+        updates = []
+        for rack in self.racks_collection.find({'rack_name_lower': {'$exists': False}}, {'rack_name': 1}):
+            updates.append(UpdateOne(
+                {'_id': rack['_id']},
+                {'$set': {'rack_name_lower': (rack.get('rack_name') or '').lower()}}
+            ))
+            if len(updates) == BACKFILL_BATCH_SIZE:
+                self.racks_collection.bulk_write(updates, ordered=False)
+                updates = []
+        if updates:
+            self.racks_collection.bulk_write(updates, ordered=False)
+    
     def search_racks(self, query: str) -> List[Dict]:
-        """Text search across rack content with embedded data"""
+        """Text search across rack content with embedded data, best matches first"""
         if not self.connected and not self.connect():
             return []
         
         try:
-            cursor = self.racks_collection.find(
-                {'$text': {'$search': query}}
-            ).sort('created_at', -1)
-            
-            racks = []
-            for doc in cursor:
-                doc['_id'] = str(doc['_id'])
-                racks.append(doc)
-            return racks
+            return list(self.iter_search_racks(query))
         except Exception as e:
             logger.error(f"Failed to search racks: {e}")
             return []
     
+    def iter_search_racks(self, query: str) -> Iterator[Dict]:
+        """Yield search results one at a time as the cursor returns them (see search_racks)"""
+        if not self.connected and not self.connect():
+            return
+        
+        prefix = QUOTED_PREFIX_QUERY.match(query)
+        if prefix:
+            cursor = self.racks_collection.find(
+                {'rack_name_lower': {'$regex': '^' + re.escape(prefix.group(1).lower())}},
+                LIST_PROJECTION
+            ).sort('rack_name_lower', 1)
+        else:
+            score = {'$meta': 'textScore'}
+            cursor = self.racks_collection.find(
+                {'$text': {'$search': query}}, {**LIST_PROJECTION, 'score': score}
+            ).sort([('score', score)])
+        
+        yield from cursor.limit(SEARCH_RESULTS_LIMIT).batch_size(
+            RECENT_RACKS_BATCH_SIZE
+        ).max_time_ms(QUERY_MAX_TIME_MS)
+    
     def increment_download_count(self, rack_id: str) -> bool:
         """Increment download count"""
         if not self.connected and not self.connect():
@@ -735,6 +1126,30 @@ class MongoDBOptimized:
         except Exception as e:
             logger.error(f"Failed to increment download count: {e}")
             return False
+    
+    def increment_download_counts(self, counts: Dict[str, int]) -> Dict[str, int]:
+        """
+        Apply batched download count increments ({rack_id: count}) in one bulk
+        write, returning the increments that were not applied
+        """
+        if not self.connected and not self.connect():
+            return counts
+        
+        rack_ids = list(counts)
+        try:
+            self.racks_collection.bulk_write([
+                UpdateOne({'_id': ObjectId(rack_id)}, {'$inc': {'engagement.download_count': counts[rack_id]}})
+                for rack_id in rack_ids
+            ], ordered=False)
+            return {}
+        except BulkWriteError as e:
+            # Unordered: every update not listed in writeErrors was applied
+            failed = [rack_ids[error['index']] for error in e.details.get('writeErrors', [])]
+            logger.error(f"Failed to increment download counts of {len(failed)} racks: {e}")
+            return {rack_id: counts[rack_id] for rack_id in failed}
+        except Exception as e:
+            logger.error(f"Failed to increment download counts: {e}")
+            return counts
 
 
 # Create global instance
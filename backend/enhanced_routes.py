@@ -10,7 +10,8 @@ import logging
 from flask import Blueprint, request, jsonify
 from functools import wraps
 import jwt
-from db import db
+from binascii import a2b_base64, b2a_base64
+from db import db, RACK_LIST_PROJECTION
 from security import sanitize_input, validate_annotation_data, validate_rating, validate_metadata
 
 logger = logging.getLogger(__name__)
@@ -371,9 +372,9 @@ def advanced_search():
         
         # Execute search
         if search_query:
-            cursor = db.collection.find(search_query).sort('created_at', -1).limit(limit)
+            cursor = db.collection.find(search_query, RACK_LIST_PROJECTION).sort('created_at', -1).limit(limit)
         else:
-            cursor = db.collection.find().sort('created_at', -1).limit(limit)
+            cursor = db.collection.find({}, RACK_LIST_PROJECTION).sort('created_at', -1).limit(limit)
         
         results = []
         for doc in cursor:
@@ -402,6 +403,8 @@ def get_trending_racks():
         
         pipeline = [
             {'$match': {'created_at': {'$gte': thirty_days_ago}}},
+            # Drop the stored file and full analysis before the sort holds every match
+            {'$project': RACK_LIST_PROJECTION},
             {
                 '$addFields': {
                     'engagement_score': {
@@ -464,7 +467,7 @@ def get_recommendations(current_user, user_id):
                 query['metadata.difficulty'] = {'$in': list(set(difficulties))}
             
             if query:
-                cursor = db.collection.find(query).sort('engagement.rating.average', -1).limit(10)
+                cursor = db.collection.find(query, RACK_LIST_PROJECTION).sort('engagement.rating.average', -1).limit(10)
                 recommendations = []
                 for doc in cursor:
                     doc['_id'] = str(doc['_id'])
@@ -495,7 +498,6 @@ def enhanced_analyze_upload():
         import tempfile
         import shutil
         import os
-        import base64
         
         # Import the analyzer functions
         import sys
@@ -536,7 +538,7 @@ def enhanced_analyze_upload():
             # Read file content for storage
             with open(filepath, 'rb') as f:
                 file_content = f.read()
-            file_content_b64 = base64.b64encode(file_content).decode('utf-8')
+            file_content_b64 = b2a_base64(file_content, newline=False).decode('ascii')
             
             # Generate auto-tags from device analysis
             auto_tags = db._extract_device_tags(rack_info)
@@ -552,11 +554,7 @@ def enhanced_analyze_upload():
                 'file_content': file_content_b64,
                 'auto_tags': auto_tags,
                 'complexity_score': complexity_score,
-                'stats': {
-                    'total_chains': len(rack_info.get('chains', [])),
-                    'total_devices': db._count_all_devices(rack_info.get('chains', [])),
-                    'macro_controls': len(rack_info.get('macro_controls', []))
-                },
+                'stats': rack_info['stats'],
                 'suggested_metadata': {
                     'title': rack_info.get('rack_name', filename.replace('.adg', '').replace('.adv', '')),
                     'auto_tags': auto_tags[:10],  # Top 10 auto tags
@@ -586,7 +584,6 @@ def complete_enhanced_upload():
     """Complete the enhanced upload with full metadata"""
     try:
         from security import validate_metadata, sanitize_input
-        import base64
         import shutil
         
         data = request.get_json()
@@ -613,7 +610,7 @@ def complete_enhanced_upload():
         annotations = data.get('annotations', [])
         
         # Decode file content
-        file_content = base64.b64decode(file_content_b64) if file_content_b64 else b''
+        file_content = a2b_base64(file_content_b64) if file_content_b64 else b''
         
         # Try to get user from token, but allow anonymous uploads
         current_user = None
@@ -663,15 +660,9 @@ def complete_enhanced_upload():
             shutil.rmtree(current_app.temp_dirs[filename], ignore_errors=True)
             del current_app.temp_dirs[filename]
         
-        # Initiate AI analysis
-        try:
-            from openai_integration import RackAIAnalyzer
-            analyzer = RackAIAnalyzer()
-            analysis_result = analyzer.analyze_rack(rack_id)
-            if 'error' not in analysis_result:
-                db.update_rack_ai_analysis(rack_id, analysis_result)
-        except Exception as ai_error:
-            logger.warning(f"AI analysis failed for rack {rack_id}: {ai_error}")
+        # Initiate AI analysis in the background
+        from ai_routes import submit_ai_analysis
+        submit_ai_analysis(rack_id)
         
         return jsonify({
             'success': True,
@@ -0,0 +1,43 @@
+"""
+Gunicorn configuration for the production server (see server.py)
+"""
+
+import os
+import multiprocessing
+
+# gevent workers by default - request handlers mostly wait on MongoDB, OpenAI
+# and disk. Set USE_GEVENT=0 for gthread workers instead. The stdlib is patched
+# before the app (and pymongo) is preloaded so sockets, locks and threads all
+# cooperate with the event loop.
+USE_GEVENT = os.environ.get('USE_GEVENT', '1').lower() in ('1', 'true', 'yes')
+if USE_GEVENT:
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+
+# Several processes for CPU-bound rack analysis, each with a thread pool to
+# overlap the MongoDB round-trips that dominate the other endpoints
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+if USE_GEVENT:
+    # Each worker serves many in-flight MongoDB/OpenAI calls as greenlets
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '1000'))
+else:
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = 120
+
+# Import the app once in the master so workers share its memory copy-on-write.
+# Database connections are only opened after the fork, in each worker.
+preload_app = True
+
+def post_fork(server, worker):
+    # Warm this worker's MongoDB pool before it takes requests
+    from app import db
+    if not db.connect():
+        worker.log.warning("MongoDB unavailable at worker start; will retry on first request")
+
+loglevel = 'info'
+accesslog = '-'
+errorlog = '-'
@@ -0,0 +1,53 @@
+"""
+orjson-backed JSON provider for the Flask apps
+"""
+
+import orjson
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+# Datetimes are passed through to DefaultJSONProvider.default so they keep
+# Flask's HTTP date format instead of orjson's ISO 8601 output
+_ORJSON_OPTIONS = (
+    orjson.OPT_SORT_KEYS
+    | orjson.OPT_NON_STR_KEYS
+    | orjson.OPT_SERIALIZE_NUMPY
+    | orjson.OPT_PASSTHROUGH_DATETIME
+)
+
+def _json_default(o):
+    # Serialize ObjectIds left in documents as their hex string
+    if isinstance(o, ObjectId):
+        return str(o)
+    return DefaultJSONProvider.default(o)
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Drop-in replacement for Flask's JSON provider using orjson.
+    request.get_json() and jsonify() both go through this provider.
+    Calls with stdlib json options orjson can't honour (indent, custom
+    separators, ...) fall back to the default provider.
+    """
+
+    default = staticmethod(_json_default)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=_ORJSON_OPTIONS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Pretty-printed output in debug mode is left to the default provider
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=_ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE),
+            mimetype=self.mimetype
+        )
@@ -97,7 +97,7 @@ class DatabaseMigration:
                     },
                     
                     'stats': {
-                        'uploads_count': old_user.get('rack_count', 0),
+                        'uploads_count': self.old_db.collection.count_documents({'user_id': str(old_user['_id'])}),
                         'total_downloads': 0,  # Will be calculated
                         'total_favorites_received': 0,  # Will be calculated
                         'average_rating': 0.0  # Will be calculated
@@ -7,6 +7,7 @@ import os
 import sys
 import logging
 from datetime import datetime
+from itertools import islice
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, BulkWriteError
 from bson import ObjectId
@@ -98,63 +99,87 @@ class MigrationManager:
         try:
             # Get batch of racks from old database
             old_racks = list(self.old_db.collection.find().skip(skip).limit(limit))
-            
-            migration_results = {
-                'processed': 0,
-                'successful': 0,
-                'failed': 0,
-                'errors': []
-            }
-            
-            for old_rack in old_racks:
-                try:
-                    rack_id = str(old_rack['_id'])
-                    
-                    # Build optimized rack document
-                    new_rack = self._convert_rack_to_v3_format(old_rack)
-                    
-                    # Embed related data
-                    new_rack = self._embed_related_data(new_rack, rack_id)
-                    
-                    # Validate document size
-                    doc_size = len(json.dumps(new_rack, default=str).encode('utf-8'))
-                    if doc_size > self.new_db.MAX_DOCUMENT_SIZE:
-                        logger.warning(f"Large document for rack {rack_id}: {doc_size} bytes")
-                    
-                    # Insert into new database
-                    new_rack['_id'] = old_rack['_id']  # Preserve original ID
-                    self.new_db.racks_collection.insert_one(new_rack)
-                    
-                    migration_results['successful'] += 1
-                    
-                    # Log successful migration
-                    self.migration_log.append({
-                        'rack_id': rack_id,
-                        'status': 'success',
-                        'timestamp': datetime.utcnow(),
-                        'doc_size': doc_size
-                    })
-                    
-                except Exception as e:
-                    error_msg = f"Failed to migrate rack {rack_id}: {e}"
-                    logger.error(error_msg)
-                    migration_results['errors'].append(error_msg)
-                    migration_results['failed'] += 1
-                    
-                    self.failed_migrations.append({
-                        'rack_id': rack_id,
-                        'error': str(e),
-                        'timestamp': datetime.utcnow()
-                    })
-                
-                migration_results['processed'] += 1
-            
-            return migration_results
+            return self._migrate_racks(old_racks)
             
         except Exception as e:
             logger.error(f"Failed to migrate racks batch: {e}")
             return {'processed': 0, 'successful': 0, 'failed': 0, 'errors': [str(e)]}
     
+    def _migrate_racks(self, old_racks: List[Dict]) -> Dict:
+        """Convert a batch of old racks and write them with a single insert_many"""
+        migration_results = {
+            'processed': len(old_racks),
+            'successful': 0,
+            'failed': 0,
+            'errors': []
+        }
+        
+        def record_failure(rack_id, error):
+            error_msg = f"Failed to migrate rack {rack_id}: {error}"
+            logger.error(error_msg)
+            migration_results['errors'].append(error_msg)
+            migration_results['failed'] += 1
+            
+            self.failed_migrations.append({
+                'rack_id': rack_id,
+                'error': str(error),
+                'timestamp': datetime.utcnow()
+            })
+        
+        new_racks = []
+        doc_sizes = []
+        for old_rack in old_racks:
+            rack_id = str(old_rack.get('_id'))
+            try:
+                # Build optimized rack document
+                new_rack = self._convert_rack_to_v3_format(old_rack)
+                
+                # Embed related data
+                new_rack = self._embed_related_data(new_rack, rack_id)
+                
+                # Validate document size
+                doc_size = len(json.dumps(new_rack, default=str).encode('utf-8'))
+                if doc_size > self.new_db.MAX_DOCUMENT_SIZE:
+                    logger.warning(f"Large document for rack {rack_id}: {doc_size} bytes")
+                
+                new_rack['_id'] = old_rack['_id']  # Preserve original ID
+                new_racks.append(new_rack)
+                doc_sizes.append(doc_size)
+                
+            except Exception as e:
+                record_failure(rack_id, e)
+        
+        if not new_racks:
+            return migration_results
+        
+        # Insert the whole batch in one round-trip; unordered so one bad
+        # document doesn't stop the rest of the batch
+        failed_indexes = set()
+        try:
+            self.new_db.racks_collection.insert_many(new_racks, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get('writeErrors', []):
+                failed_indexes.add(write_error['index'])
+                record_failure(str(new_racks[write_error['index']]['_id']), write_error.get('errmsg'))
+        except Exception as e:
+            for new_rack in new_racks:
+                record_failure(str(new_rack['_id']), e)
+            return migration_results
+        
+        # Log successful migrations
+        for index, new_rack in enumerate(new_racks):
+            if index in failed_indexes:
+                continue
+            migration_results['successful'] += 1
+            self.migration_log.append({
+                'rack_id': str(new_rack['_id']),
+                'status': 'success',
+                'timestamp': datetime.utcnow(),
+                'doc_size': doc_sizes[index]
+            })
+        
+        return migration_results
+    
     def _convert_rack_to_v3_format(self, old_rack: Dict) -> Dict:
         """Convert old rack format to optimized v3 format"""
         try:
@@ -490,13 +515,19 @@ class MigrationManager:
             
             # Migrate racks in batches
             logger.info("Starting racks migration...")
-            total_racks = analysis.get('racks_count', 0)
             processed_racks = 0
             
-            while processed_racks < total_racks:
-                logger.info(f"Processing racks batch: {processed_racks} to {processed_racks + self.batch_size}")
+            # Stream the old collection through one cursor instead of
+            # re-querying with an ever-growing skip for each batch
+            cursor = self.old_db.collection.find().batch_size(self.batch_size)
+            while True:
+                old_racks = list(islice(cursor, self.batch_size))
+                if not old_racks:  # No more documents
+                    break
+                
+                logger.info(f"Processing racks batch: {processed_racks} to {processed_racks + len(old_racks)}")
                 
-                batch_result = self.migrate_racks_batch(skip=processed_racks, limit=self.batch_size)
+                batch_result = self._migrate_racks(old_racks)
                 
                 # Update summary
                 migration_summary['racks_migration']['processed'] += batch_result['processed']
@@ -505,9 +536,6 @@ class MigrationManager:
                 migration_summary['errors'].extend(batch_result['errors'])
                 
                 processed_racks += batch_result['processed']
-                
-                if batch_result['processed'] == 0:  # No more documents
-                    break
             
             # Migrate users
             logger.info("Starting users migration...")
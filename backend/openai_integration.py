@@ -7,7 +7,7 @@ import os
 import json
 from typing import Dict, List, Optional
 from openai import OpenAI
-from db import MongoDB
+from db import db
 
 class RackAIAnalyzer:
     """Simple AI analyzer for Ableton racks using OpenAI"""
@@ -18,8 +18,10 @@ class RackAIAnalyzer:
             raise ValueError("OpenAI API key is required. Set OPENAI_API_KEY environment variable.")
         
         self.client = OpenAI(api_key=self.api_key)
-        self.mongodb = MongoDB()
-        self.mongodb.connect()
+        # Share the app's pooled MongoDB client rather than opening another one
+        self.mongodb = db
+        if not self.mongodb.connected:
+            self.mongodb.connect()
     
     def analyze_rack(self, rack_id: str) -> Dict:
         """Analyze a single rack and provide insights"""
@@ -144,7 +146,7 @@ Highlight key differences in structure, device choices, and macro mappings."""
             racks = [r for r in racks if r]  # Filter out None values
         else:
             # Get all recent racks
-            racks = self.mongodb.get_recent_racks(10)
+            racks = self.mongodb.get_recent_racks(10, include_analysis=True)
         
         if not racks:
             return {"error": "No racks found"}
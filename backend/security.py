@@ -5,6 +5,33 @@ Security utilities for enhanced password validation and email validation
 import re
 from typing import Tuple
 
+# Patterns and word lists compiled once at import instead of on every call
+_UPPERCASE_RE = re.compile(r"[A-Z]")
+_LOWERCASE_RE = re.compile(r"[a-z]")
+_DIGIT_RE = re.compile(r"\d")
+_SPECIAL_CHAR_RE = re.compile(r"[!@#$%^&*(),.?\":{}|<>]")
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+_USERNAME_STRIP_RE = re.compile(r'[^a-zA-Z0-9_-]')
+_HTML_TAG_RE = re.compile(r'<[^>]*>')
+_DANGEROUS_CHARS_RE = re.compile(r'[<>"\']')
+
+# Default rack file types accepted by validate_file_upload, with the
+# suffixes checked by a single str.endswith call
+_UPLOAD_EXTENSIONS = frozenset({'adg', 'adv'})
+_UPLOAD_SUFFIXES = tuple('.' + ext for ext in sorted(_UPLOAD_EXTENSIONS))
+
+# Common weak passwords
+_WEAK_PASSWORDS = frozenset([
+    "password", "12345678", "qwerty", "abc123", "password123",
+    "admin", "letmein", "welcome", "monkey", "dragon"
+])
+
+# Common disposable email domains
+_DISPOSABLE_DOMAINS = frozenset([
+    "tempmail.com", "throwaway.email", "guerillamail.com",
+    "mailinator.com", "10minutemail.com", "trashmail.com"
+])
+
 def validate_password(password: str) -> Tuple[bool, str]:
     """
     Validate password strength with enhanced requirements
@@ -15,25 +42,20 @@ def validate_password(password: str) -> Tuple[bool, str]:
     if len(password) < 8:
         return False, "Password must be at least 8 characters long"
     
-    if not re.search(r"[A-Z]", password):
+    if not _UPPERCASE_RE.search(password):
         return False, "Password must contain at least one uppercase letter"
     
-    if not re.search(r"[a-z]", password):
+    if not _LOWERCASE_RE.search(password):
         return False, "Password must contain at least one lowercase letter"
     
-    if not re.search(r"\d", password):
+    if not _DIGIT_RE.search(password):
         return False, "Password must contain at least one number"
     
-    if not re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
+    if not _SPECIAL_CHAR_RE.search(password):
         return False, "Password must contain at least one special character"
     
     # Check for common weak passwords
-    weak_passwords = [
-        "password", "12345678", "qwerty", "abc123", "password123",
-        "admin", "letmein", "welcome", "monkey", "dragon"
-    ]
-    
-    if password.lower() in weak_passwords:
+    if password.lower() in _WEAK_PASSWORDS:
         return False, "This password is too common. Please choose a stronger password"
     
     return True, ""
@@ -45,20 +67,13 @@ def validate_email(email: str) -> Tuple[bool, str]:
     Returns:
         Tuple[bool, str]: (is_valid, error_message)
     """
-    # Basic email regex pattern
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    
-    if not re.match(pattern, email):
+    # Basic email format check
+    if not _EMAIL_RE.match(email):
         return False, "Invalid email format"
     
     # Check for common disposable email domains
-    disposable_domains = [
-        "tempmail.com", "throwaway.email", "guerillamail.com",
-        "mailinator.com", "10minutemail.com", "trashmail.com"
-    ]
-    
     domain = email.split('@')[1].lower()
-    if domain in disposable_domains:
+    if domain in _DISPOSABLE_DOMAINS:
         return False, "Disposable email addresses are not allowed"
     
     return True, ""
@@ -68,7 +83,7 @@ def sanitize_username(username: str) -> str:
     Sanitize username to prevent injection attacks
     """
     # Remove any non-alphanumeric characters except underscore and hyphen
-    sanitized = re.sub(r'[^a-zA-Z0-9_-]', '', username)
+    sanitized = _USERNAME_STRIP_RE.sub('', username)
     
     # Limit length
     return sanitized[:30]
@@ -82,8 +97,8 @@ def sanitize_input(text: str) -> str:
     
     # Remove HTML tags and potentially dangerous characters
     # Keep basic punctuation and international characters
-    sanitized = re.sub(r'<[^>]*>', '', text)  # Remove HTML tags
-    sanitized = re.sub(r'[<>"\']', '', sanitized)  # Remove dangerous chars
+    sanitized = _HTML_TAG_RE.sub('', text)  # Remove HTML tags
+    sanitized = _DANGEROUS_CHARS_RE.sub('', sanitized)  # Remove dangerous chars
     
     # Limit length for performance
     return sanitized[:2000].strip()
@@ -170,7 +185,9 @@ def validate_file_upload(file_obj, allowed_extensions=None) -> Tuple[bool, str]:
     Enhanced file upload validation
     """
     if allowed_extensions is None:
-        allowed_extensions = {'adg', 'adv'}
+        allowed_extensions, allowed_suffixes = _UPLOAD_EXTENSIONS, _UPLOAD_SUFFIXES
+    else:
+        allowed_suffixes = tuple('.' + ext for ext in allowed_extensions)
     
     # Check if file exists
     if not file_obj:
@@ -184,8 +201,7 @@ def validate_file_upload(file_obj, allowed_extensions=None) -> Tuple[bool, str]:
     if '.' not in file_obj.filename:
         return False, "File must have an extension"
     
-    ext = file_obj.filename.rsplit('.', 1)[1].lower()
-    if ext not in allowed_extensions:
+    if not file_obj.filename.lower().endswith(allowed_suffixes):
         return False, f"Invalid file type. Only {', '.join(allowed_extensions)} files are allowed"
     
     # Check file size (max 50MB for enhanced features)
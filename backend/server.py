@@ -23,8 +23,6 @@ def try_gunicorn():
         from app import app
         logger.info("✅ Flask app imported successfully")
         
-        port = os.environ.get('PORT', '5001')
-        
         # Try different python executables in order of preference
         python_candidates = [
             '/opt/venv/bin/python',  # Railway virtual environment
@@ -46,16 +44,13 @@ def try_gunicorn():
             logger.error("No suitable python executable found")
             return False
         
+        # Workers, threads and preloading are set in gunicorn.conf.py
+        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+        
         cmd = [
             python_exe, '-m', 'gunicorn', 
             'app:app',
-            '--bind', f'0.0.0.0:{port}',
-            '--workers', '1',
-            '--timeout', '120',
-            '--preload',
-            '--log-level', 'info',
-            '--access-logfile', '-',
-            '--error-logfile', '-'
+            '--config', config_path
         ]
         
         logger.info(f"🎯 Starting gunicorn: {' '.join(cmd)}")
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Test that compressed SPA responses still answer conditional requests with a 304
+"""
+import pytest
+
+from app import app
+
+
+@pytest.mark.parametrize('encoding', ['br', 'gzip'])
+def test_compressed_index_etag_revalidates(encoding, monkeypatch):
+    # index.html is under the production COMPRESS_MIN_SIZE
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', 0)
+    client = app.test_client()
+
+    first = client.get('/', headers={'Accept-Encoding': encoding})
+    assert first.status_code == 200
+    assert first.headers['Content-Encoding'] == encoding
+    etag = first.headers['ETag']
+    assert etag.endswith(f':{encoding}"')
+
+    second = client.get('/', headers={'Accept-Encoding': encoding, 'If-None-Match': etag})
+    assert second.status_code == 304
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
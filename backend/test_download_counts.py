@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test that batched download counts are flushed once, and that only the
+increments a bulk write failed to apply are queued again
+"""
+import os
+
+import pytest
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import app as app_module
+from db import MongoDB
+
+
+class StubRacks:
+    """Racks collection whose bulk_write records its updates and fails the ones at failed_indexes"""
+
+    def __init__(self, failed_indexes=(), error=None):
+        self.failed_indexes = failed_indexes
+        self.error = error
+        self.requests = []
+
+    def bulk_write(self, requests, ordered=True):
+        assert not ordered
+        self.requests.extend(requests)
+        if self.error:
+            raise self.error
+        if self.failed_indexes:
+            raise BulkWriteError({
+                'writeErrors': [
+                    {'index': index, 'code': 121, 'errmsg': 'Document failed validation'}
+                    for index in self.failed_indexes
+                ],
+                'nModified': len(requests) - len(self.failed_indexes)
+            })
+
+
+@pytest.fixture
+def rack_ids():
+    return [str(ObjectId()) for _ in range(3)]
+
+
+@pytest.fixture
+def pending(monkeypatch):
+    """The app's download count queue, emptied, with no flusher thread started"""
+    monkeypatch.setattr(app_module, '_download_flusher_pid', os.getpid())
+    app_module._pending_downloads.clear()
+    yield app_module._pending_downloads
+    app_module._pending_downloads.clear()
+
+
+def _use_racks(monkeypatch, racks):
+    monkeypatch.setattr(app_module.db, 'racks_collection', racks)
+    monkeypatch.setattr(app_module.db, 'connected', True)
+
+
+def test_flush_writes_queued_counts_once(monkeypatch, pending, rack_ids):
+    racks = StubRacks()
+    _use_racks(monkeypatch, racks)
+    for rack_id in (rack_ids[0], rack_ids[1], rack_ids[0]):
+        app_module._queue_download_count(rack_id)
+
+    app_module._flush_download_counts()
+    app_module._flush_download_counts()
+
+    assert racks.requests == [
+        UpdateOne({'_id': ObjectId(rack_ids[0])}, {'$inc': {'engagement.download_count': 2}}),
+        UpdateOne({'_id': ObjectId(rack_ids[1])}, {'$inc': {'engagement.download_count': 1}})
+    ]
+    assert not pending
+
+
+def test_flush_requeues_only_failed_increments(monkeypatch, pending, rack_ids):
+    _use_racks(monkeypatch, StubRacks(failed_indexes=[1]))
+    pending.update({rack_ids[0]: 2, rack_ids[1]: 1, rack_ids[2]: 5})
+
+    app_module._flush_download_counts()
+
+    assert dict(pending) == {rack_ids[1]: 1}
+
+
+def test_flush_requeues_everything_when_outcome_unknown(monkeypatch, pending, rack_ids):
+    _use_racks(monkeypatch, StubRacks(error=AutoReconnect('connection reset')))
+    pending.update({rack_ids[0]: 2, rack_ids[1]: 1})
+
+    app_module._flush_download_counts()
+
+    assert dict(pending) == {rack_ids[0]: 2, rack_ids[1]: 1}
+
+
+def test_db_increment_download_counts_returns_failed_increments(rack_ids):
+    mongo = MongoDB()
+    mongo.collection = StubRacks(failed_indexes=[0, 2])
+    mongo.connected = True
+
+    counts = {rack_ids[0]: 1, rack_ids[1]: 4, rack_ids[2]: 3}
+    assert mongo.increment_download_counts(counts) == {rack_ids[0]: 1, rack_ids[2]: 3}
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
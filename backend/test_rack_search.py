@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Test rack search query building (text index vs quoted name prefix), the
+weighted text index setup and the rack_name_lower backfill
+"""
+import pytest
+from pymongo import UpdateOne
+
+from db import MongoDB
+import db_v3_optimized
+from db_v3_optimized import MongoDBOptimized, RACK_TEXT_FIELDS, RACK_TEXT_INDEX, RACK_TEXT_WEIGHTS
+
+
+class StubCursor:
+    """Chainable cursor over fixed documents that records how it was sorted"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.sort_spec = None
+
+    def sort(self, key, direction=None):
+        self.sort_spec = key if direction is None else [(key, direction)]
+        return self
+
+    def limit(self, limit):
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        return self
+
+    def __iter__(self):
+        return iter(self.documents)
+
+
+class StubRacks:
+    """Racks collection recording finds, bulk writes and index changes"""
+
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+        self.finds = []
+        self.cursors = []
+        self.bulk_writes = []
+        self.dropped = []
+        self.created = []
+
+    def find(self, search_filter=None, projection=None):
+        self.finds.append((search_filter, projection))
+        self.cursors.append(StubCursor(self.documents))
+        return self.cursors[-1]
+
+    def bulk_write(self, requests, ordered=True):
+        self.bulk_writes.append(list(requests))
+
+    def drop_index(self, name):
+        self.dropped.append(name)
+
+    def create_index(self, keys, **kwargs):
+        self.created.append((keys, kwargs))
+
+
+def _mongo(racks):
+    mongo = MongoDB()
+    mongo.collection = mongo.list_collection = racks
+    mongo.connected = True
+    return mongo
+
+
+def _mongo_v3(racks):
+    mongo = MongoDBOptimized()
+    mongo.racks_collection = racks
+    mongo.connected = True
+    return mongo
+
+
+def test_quoted_prefix_query_is_an_escaped_anchored_regex():
+    racks = StubRacks()
+    _mongo(racks).search_racks('"Über.Bass*"')
+
+    search_filter, projection = racks.finds[0]
+    assert search_filter == {'rack_name_lower': {'$regex': r'^über\.bass'}}
+    assert 'score' not in projection
+    assert racks.cursors[0].sort_spec == [('rack_name_lower', 1)]
+
+
+def test_quoted_prefix_query_v3():
+    racks = StubRacks()
+    list(_mongo_v3(racks).iter_search_racks('"Über.Bass*"'))
+
+    search_filter, _ = racks.finds[0]
+    assert search_filter == {'rack_name_lower': {'$regex': r'^über\.bass'}}
+    assert racks.cursors[0].sort_spec == [('rack_name_lower', 1)]
+
+
+@pytest.mark.parametrize('query', ['bass', '"warm pad"', 'Bass*'])
+def test_other_queries_use_the_text_index_ranked_by_score(query):
+    racks = StubRacks()
+    _mongo(racks).search_racks(query)
+
+    search_filter, projection = racks.finds[0]
+    assert search_filter == {'$text': {'$search': query}}
+    assert projection['score'] == {'$meta': 'textScore'}
+    assert racks.cursors[0].sort_spec == [('score', {'$meta': 'textScore'})]
+
+
+def test_tag_filter_is_combined_with_the_text_search():
+    racks = StubRacks()
+    _mongo(racks).search_racks_with_tags('bass', ['reverb'])
+
+    search_filter, _ = racks.finds[0]
+    assert search_filter == {'$and': [{'$text': {'$search': 'bass'}}, {'tags': {'$in': ['reverb']}}]}
+
+
+@pytest.mark.parametrize('make_mongo', [_mongo, _mongo_v3])
+def test_backfill_lowercases_non_ascii_names_in_python(make_mongo):
+    racks = StubRacks([
+        {'_id': 1, 'rack_name': 'Überbass'},
+        {'_id': 2, 'rack_name': 'ÉCHO Chamber'},
+        {'_id': 3}
+    ])
+    make_mongo(racks)._backfill_rack_name_lower()
+
+    assert racks.finds[0][0] == {'rack_name_lower': {'$exists': False}}
+    assert racks.bulk_writes == [[
+        UpdateOne({'_id': 1}, {'$set': {'rack_name_lower': 'überbass'}}),
+        UpdateOne({'_id': 2}, {'$set': {'rack_name_lower': 'écho chamber'}}),
+        UpdateOne({'_id': 3}, {'$set': {'rack_name_lower': ''}})
+    ]]
+
+
+def test_backfill_writes_in_batches(monkeypatch):
+    monkeypatch.setattr(db_v3_optimized, 'BACKFILL_BATCH_SIZE', 2)
+    racks = StubRacks([{'_id': index, 'rack_name': f'Rack {index}'} for index in range(5)])
+    _mongo_v3(racks)._backfill_rack_name_lower()
+
+    assert [len(batch) for batch in racks.bulk_writes] == [2, 2, 1]
+
+
+def _text_index_info(weights):
+    return {'key': [('_fts', 'text'), ('_ftsx', 1)], 'weights': weights}
+
+
+def test_text_index_replaces_other_text_indexes():
+    racks = StubRacks()
+    existing = {
+        '_id_': {'key': [('_id', 1)]},
+        'rack_name_text_filename_text': _text_index_info({'rack_name': 1, 'filename': 1})
+    }
+    _mongo_v3(racks)._ensure_text_index(existing)
+
+    assert racks.dropped == ['rack_name_text_filename_text']
+    keys, options = racks.created[0]
+    assert keys == [(field, 'text') for field in RACK_TEXT_FIELDS]
+    assert options['name'] == RACK_TEXT_INDEX
+    assert options['weights'] == {field: RACK_TEXT_WEIGHTS.get(field, 1) for field in RACK_TEXT_FIELDS}
+
+
+def test_current_text_index_is_kept():
+    racks = StubRacks()
+    weights = {field: RACK_TEXT_WEIGHTS.get(field, 1) for field in RACK_TEXT_FIELDS}
+    _mongo_v3(racks)._ensure_text_index({RACK_TEXT_INDEX: _text_index_info(weights)})
+
+    assert racks.dropped == []
+    assert racks.created == []
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
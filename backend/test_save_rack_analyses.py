@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test that a partially failed batch insert reports which racks were saved and
+only deletes the stored files of the racks that weren't
+"""
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from db_v3_optimized import MongoDBOptimized
+
+
+class StubFS:
+    """GridFS stand-in recording the ids it hands out and deletes"""
+
+    def __init__(self):
+        self.files = []
+        self.deleted = []
+
+    def put(self, data, **kwargs):
+        self.files.append(ObjectId())
+        return self.files[-1]
+
+    def delete(self, file_id):
+        self.deleted.append(file_id)
+
+
+class StubRacks:
+    """
+    Racks collection whose insert_many assigns _ids like pymongo, stores the
+    documents not at failed_indexes and then raises error (a BulkWriteError
+    listing failed_indexes by default)
+    """
+
+    def __init__(self, failed_indexes=(), error=None, find_error=None):
+        self.failed_indexes = set(failed_indexes)
+        self.error = error
+        self.find_error = find_error
+        self.stored = []
+
+    def insert_many(self, documents, ordered=True):
+        assert not ordered
+        for index, document in enumerate(documents):
+            document.setdefault('_id', ObjectId())
+            if index not in self.failed_indexes:
+                self.stored.append(document)
+        if self.error:
+            raise self.error
+        if self.failed_indexes:
+            raise BulkWriteError({
+                'writeErrors': [
+                    {'index': index, 'code': 11000, 'errmsg': 'E11000 duplicate key error'}
+                    for index in sorted(self.failed_indexes)
+                ],
+                'nInserted': len(documents) - len(self.failed_indexes)
+            })
+
+    def find(self, search_filter, projection=None):
+        if self.find_error:
+            raise self.find_error
+        wanted = set(search_filter['_id']['$in'])
+        return [{'_id': document['_id']} for document in self.stored if document['_id'] in wanted]
+
+
+def _racks(count):
+    return [
+        {
+            'rack_info': {'rack_name': f'Rack {index}', 'chains': [], 'macro_controls': []},
+            'filename': f'rack{index}.adg',
+            'file_content': f'file {index}'.encode()
+        }
+        for index in range(count)
+    ]
+
+
+def _mongo(racks_collection):
+    mongo = MongoDBOptimized()
+    mongo.racks_collection = racks_collection
+    mongo.fs = StubFS()
+    mongo.connected = True
+    return mongo
+
+
+def test_write_errors_mark_only_their_racks_failed():
+    racks_collection = StubRacks(failed_indexes=[1])
+    mongo = _mongo(racks_collection)
+
+    ids = mongo.save_rack_analyses(_racks(3))
+
+    saved = racks_collection.stored
+    assert [rack['filename'] for rack in saved] == ['rack0.adg', 'rack2.adg']
+    assert ids == [str(saved[0]['_id']), None, str(saved[1]['_id'])]
+    assert mongo.fs.deleted == [mongo.fs.files[1]]
+
+
+def test_unbuildable_racks_are_reported_failed_in_place():
+    racks = _racks(3)
+    racks[0]['rack_info'] = None
+    racks_collection = StubRacks()
+
+    ids = _mongo(racks_collection).save_rack_analyses(racks)
+
+    assert ids[0] is None
+    assert ids[1:] == [str(rack['_id']) for rack in racks_collection.stored]
+
+
+def test_interrupted_batch_checks_which_racks_were_saved():
+    racks_collection = StubRacks(failed_indexes=[0, 2], error=AutoReconnect('connection reset'))
+    mongo = _mongo(racks_collection)
+
+    ids = mongo.save_rack_analyses(_racks(3))
+
+    assert ids == [None, str(racks_collection.stored[0]['_id']), None]
+    assert mongo.fs.deleted == [mongo.fs.files[0], mongo.fs.files[2]]
+
+
+def test_unknown_outcome_fails_the_batch_but_keeps_files():
+    racks_collection = StubRacks(
+        failed_indexes=[1], error=AutoReconnect('connection reset'), find_error=AutoReconnect('still down')
+    )
+    mongo = _mongo(racks_collection)
+
+    assert mongo.save_rack_analyses(_racks(3)) == [None, None, None]
+    assert mongo.fs.deleted == []
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
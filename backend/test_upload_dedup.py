@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test that re-uploading an identical rack file reuses the stored analysis,
+but only an analysis made by the current analyzer version
+"""
+import hashlib
+import io
+
+import pytest
+
+import app as app_module
+from abletonRackAnalyzer import ANALYZER_VERSION
+
+RACK_FILE = b'identical rack file bytes'
+
+
+class StubRacks:
+    """Racks collection whose find_one matches stored documents by field equality"""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find_one(self, search_filter, projection=None):
+        for document in self.documents:
+            if all(document.get(field) == value for field, value in search_filter.items()):
+                return {'_id': document['_id'], 'analysis': document['analysis']}
+        return None
+
+
+@pytest.fixture
+def upload(monkeypatch):
+    """Post RACK_FILE as filename, returning the rack_info passed to save_rack_document"""
+    monkeypatch.setattr(app_module.limiter, 'enabled', False)
+    monkeypatch.setattr(app_module.db, 'connected', True)
+    saved = []
+
+    def save_rack_document(rack_info, filename, **kwargs):
+        saved.append(rack_info)
+        return {'_id': 'new-rack', 'rack_name': rack_info['rack_name']}
+
+    monkeypatch.setattr(app_module.db, 'save_rack_document', save_rack_document)
+    client = app_module.app.test_client()
+
+    def post(filename):
+        response = client.post(
+            '/api/analyze',
+            data={'file': (io.BytesIO(RACK_FILE), filename)},
+            content_type='multipart/form-data'
+        )
+        assert response.status_code == 200, response.get_json()
+        return saved[-1]
+
+    return post
+
+
+def _stored_analysis(analyzer_version):
+    return {
+        '_id': 'first-rack',
+        'content_sha256': hashlib.sha256(RACK_FILE).hexdigest(),
+        'analyzer_version': analyzer_version,
+        'analysis': {
+            'rack_name': 'Original Name',
+            'use_case': 'Original Name',
+            'rack_type': 'AudioEffectGroupDevice',
+            'chains': [{'name': 'Chain 1', 'devices': [{'name': 'Reverb'}]}],
+            'macro_controls': []
+        }
+    }
+
+
+def test_identical_upload_reuses_analysis_under_new_name(monkeypatch, upload):
+    monkeypatch.setattr(app_module.db, 'racks_collection', StubRacks([_stored_analysis(ANALYZER_VERSION)]))
+
+    def analyze_in_pool(filepath, filename):
+        raise AssertionError('identical upload was parsed again')
+
+    monkeypatch.setattr(app_module, '_analyze_in_pool', analyze_in_pool)
+
+    rack_info = upload('second-upload.adg')
+
+    assert rack_info['rack_name'] == rack_info['use_case'] == 'second-upload'
+    assert rack_info['chains'] == [{'name': 'Chain 1', 'devices': [{'name': 'Reverb'}]}]
+
+
+def test_analysis_from_older_analyzer_is_not_reused(monkeypatch, upload):
+    monkeypatch.setattr(app_module.db, 'racks_collection', StubRacks([_stored_analysis(ANALYZER_VERSION - 1)]))
+    analyzed = []
+
+    def analyze_in_pool(filepath, filename):
+        analyzed.append(filename)
+        return {'rack_name': 'second-upload', 'use_case': 'second-upload', 'chains': [], 'macro_controls': []}
+
+    monkeypatch.setattr(app_module, '_analyze_in_pool', analyze_in_pool)
+
+    rack_info = upload('second-upload.adg')
+
+    assert analyzed == ['second-upload.adg']
+    assert rack_info['chains'] == []
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))